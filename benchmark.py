@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from template_bank import TEMPLATE_EXTENSIONS, TemplateBank, decode_template_frames
+from template_matching import EXECUTOR_KINDS, MATCH_MODES, box_iou, match_templates, result_box
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def load_sprites(template_dir):
+    """Decodes every template file in `template_dir` for synthesize_canvas(): {filename: frames}."""
+    sprites = {}
+    for filename in sorted(os.listdir(template_dir)):
+        if filename.endswith(TEMPLATE_EXTENSIONS):
+            frames = decode_template_frames(os.path.join(template_dir, filename))
+            if frames:
+                sprites[filename] = frames
+    return sprites
+
+
+def load_backgrounds(background_dir):
+    """Reads the images in `background_dir` (skipping anything OpenCV can't read); [] without a directory."""
+    background_images = []
+    if background_dir:
+        for filename in sorted(os.listdir(background_dir)):
+            image = cv2.imread(os.path.join(background_dir, filename))
+            if image is not None:
+                background_images.append(image)
+    return background_images
+
+
+def make_background(rng, width, height, background_images=None):
+    """
+    Returns a BGR background: a random crop of one of `background_images` if given, otherwise a
+    procedural map-like texture (tiled colour patches plus blurred noise).
+    """
+    if background_images:
+        source = background_images[int(rng.integers(len(background_images)))]
+        if source.shape[0] >= height and source.shape[1] >= width:
+            y = int(rng.integers(source.shape[0] - height + 1))
+            x = int(rng.integers(source.shape[1] - width + 1))
+            return source[y:y + height, x:x + width].copy()
+        return cv2.resize(source, (width, height))
+
+    tile = 32
+    tiles = rng.integers(40, 200, ((height + tile - 1) // tile, (width + tile - 1) // tile, 3), dtype=np.uint8)
+    background = cv2.resize(tiles, None, fx=tile, fy=tile, interpolation=cv2.INTER_NEAREST)[:height, :width]
+    noise = cv2.GaussianBlur(rng.normal(0, 25, (height, width, 3)), (0, 0), 2)
+    return np.clip(background + noise, 0, 255).astype(np.uint8)
+
+
+def synthesize_canvas(sprites, rng, width=800, height=512, sprite_count=8, background_images=None):
+    """
+    Composites `sprite_count` randomly chosen sprites (random animation frame, no overlaps) onto a
+    background. Returns the BGR canvas and the ground truth as dicts with 'filename', 'frame' and
+    'box' = (x, y, w, h) of the sprite's opaque pixels.
+    """
+    canvas = make_background(rng, width, height, background_images)
+    filenames = sorted(sprites)
+    placed = []
+    truth = []
+    for _ in range(sprite_count * 20):
+        if len(truth) == sprite_count:
+            break
+        filename = filenames[int(rng.integers(len(filenames)))]
+        frame_index = int(rng.integers(len(sprites[filename])))
+        _, alpha, bgr = sprites[filename][frame_index]
+        opaque = alpha > 0
+        h, w = opaque.shape
+        if w > width or h > height:
+            continue
+        x, y = int(rng.integers(width - w + 1)), int(rng.integers(height - h + 1))
+        if any(x < px + pw and px < x + w and y < py + ph and py < y + h for px, py, pw, ph in placed):
+            continue
+        placed.append((x, y, w, h))
+        canvas[y:y + h, x:x + w][opaque] = bgr[opaque]
+        bx, by, bw, bh = cv2.boundingRect(opaque.astype(np.uint8))
+        truth.append({'filename': filename, 'frame': frame_index, 'box': (x + bx, y + by, bw, bh)})
+    return canvas, truth
+
+
+def score_detections(detections, truth, iou_threshold=0.5):
+    """
+    Greedily pairs detections (highest confidence first) with unmatched ground-truth sprites of
+    the same template overlapping them by `iou_threshold`. Returns (true positives, detections, truths).
+    """
+    unmatched = list(truth)
+    true_positives = 0
+    for detection in sorted(detections, key=lambda d: d['confidence'], reverse=True):
+        box = result_box(detection)
+        for t in unmatched:
+            if t['filename'] == detection['filename'] and box_iou(box, t['box']) >= iou_threshold:
+                unmatched.remove(t)
+                true_positives += 1
+                break
+    return true_positives, len(detections), len(truth)
+
+
+def _percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000)
+
+
+def run_config(frames, bank, threshold, mode, workers, executor, match_options):
+    """Matches every synthesized frame with one configuration and returns its metrics."""
+    # Warm-up: pool start-up and lazily built pyramid templates shouldn't count
+    match_templates(frames[0][0], bank, threshold, mode, workers, executor, **match_options)
+
+    latencies = []
+    true_positives = detected = expected = 0
+    for canvas_gray, truth in frames:
+        start = time.perf_counter()
+        detections = match_templates(canvas_gray, bank, threshold, mode, workers, executor, **match_options)
+        latencies.append(time.perf_counter() - start)
+        tp, d, e = score_detections(detections, truth)
+        true_positives += tp
+        detected += d
+        expected += e
+
+    # Separate pass for memory, as tracing slows matching down
+    tracemalloc.start()
+    match_templates(frames[0][0], bank, threshold, mode, workers, executor, **match_options)
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean_latency = float(np.mean(latencies))
+    return {
+        'threshold': threshold,
+        'mode': mode,
+        'workers': workers,
+        'executor': executor,
+        'frames': len(frames),
+        'latency_ms': {
+            'mean': mean_latency * 1000,
+            'p50': _percentile_ms(latencies, 50),
+            'p90': _percentile_ms(latencies, 90),
+            'p99': _percentile_ms(latencies, 99),
+            'max': max(latencies) * 1000,
+        },
+        'templates_per_second': len(bank) / mean_latency,
+        'peak_traced_mb': peak_traced / 2 ** 20,
+        'precision': true_positives / detected if detected else 1.0,
+        'recall': true_positives / expected if expected else 1.0,
+    }
+
+
+def run_benchmark(template_dir, thresholds=(0.7,), worker_counts=(1,), modes=('exhaustive',), executor='thread',
+                  frame_count=10, width=800, height=512, sprite_count=8, seed=0, background_dir=None,
+                  max_frames_per_enemy=None, match_options=None):
+    """
+    Synthesizes `frame_count` canvases from the templates in template_dir and measures every
+    combination of threshold, worker count and matcher mode on them. Fully offline.
+    Returns a JSON-serialisable report.
+    """
+    load_options = {} if max_frames_per_enemy is None else {'max_frames_per_enemy': max_frames_per_enemy}
+    bank = TemplateBank.load(template_dir, **load_options)
+    sprites = load_sprites(template_dir)
+    background_images = load_backgrounds(background_dir)
+
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(frame_count):
+        canvas, truth = synthesize_canvas(sprites, rng, width, height, sprite_count, background_images)
+        frames.append((cv2.cvtColor(canvas, cv2.COLOR_BGR2GRAY), truth))
+
+    results = []
+    for mode in modes:
+        for workers in worker_counts:
+            for threshold in thresholds:
+                print(f"Benchmarking mode={mode} workers={workers} threshold={threshold}...")
+                results.append(run_config(frames, bank, threshold, mode, workers, executor, match_options or {}))
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'templates': len(bank),
+        'canvas': {'width': width, 'height': height, 'sprites': sprite_count, 'frames': frame_count, 'seed': seed},
+        'results': results,
+    }
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report['max_rss_mb'] = max_rss / (2 ** 20 if platform.system() == 'Darwin' else 2 ** 10)
+    return report
+
+
+def _parse_list(value, cast):
+    return [cast(v) for v in value.split(',')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline speed/accuracy benchmark for enemy detection")
+    parser.add_argument("--templates", default="templates/enemies", help="Directory containing enemy templates")
+    parser.add_argument("--thresholds", default="0.7", help="Comma-separated matching thresholds to sweep")
+    parser.add_argument("--workers", default="1", help="Comma-separated worker counts to sweep")
+    parser.add_argument("--modes", default="exhaustive,pyramid", help=f"Comma-separated matcher modes ({', '.join(MATCH_MODES)})")
+    parser.add_argument("--executor", choices=EXECUTOR_KINDS, default="thread", help="Pool type used when workers > 1")
+    parser.add_argument("--frames", type=int, default=10, help="Number of synthetic canvases")
+    parser.add_argument("--width", type=int, default=800, help="Canvas width")
+    parser.add_argument("--height", type=int, default=512, help="Canvas height")
+    parser.add_argument("--sprites", type=int, default=8, help="Sprites composited per canvas")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, so runs are comparable")
+    parser.add_argument("--backgrounds", help="Directory of background images (e.g. empty map screenshots)")
+    parser.add_argument("--max-frames-per-enemy", type=int, help="Distinct animation frames matched per enemy")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.templates,
+        thresholds=_parse_list(args.thresholds, float),
+        worker_counts=_parse_list(args.workers, int),
+        modes=_parse_list(args.modes, str),
+        executor=args.executor,
+        frame_count=args.frames,
+        width=args.width,
+        height=args.height,
+        sprite_count=args.sprites,
+        seed=args.seed,
+        background_dir=args.backgrounds,
+        max_frames_per_enemy=args.max_frames_per_enemy,
+    )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Benchmark report saved to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,202 @@
+import asyncio
+import signal
+import time
+from instrumentation import timed, timed_loop
+
+
+class LatestQueue:
+    """
+    Bounded asyncio queue that never blocks the producer: when it is full, put() discards the
+    oldest item to make room. With the default maxsize=1 a consumer always gets the most recent
+    item and anything it had no time for is dropped rather than queued.
+    """
+
+    def __init__(self, maxsize=1):
+        self._queue = asyncio.Queue(maxsize)
+        self.puts = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+        self.puts += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    async def get(self):
+        return await self._queue.get()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        return {'depth': self.depth(), 'max_depth': self.max_depth, 'puts': self.puts, 'dropped': self.dropped}
+
+
+class BotPipeline:
+    """
+    Runs capture, detection and action as three concurrent tasks linked by LatestQueues, so
+    detecting frame N+1 overlaps with acting on frame N and a slow stage drops stale work
+    instead of stalling the others.
+
+    Args:
+        frame_source: Callable returning an async iterable of captured items (e.g. frames plus
+            page state), such as an async generator function; the pipeline stops when an
+            iterable is exhausted. A plain async iterable is accepted too, but can't be restarted
+            after an error
+        detect: async detect(item) -> detections; should offload heavy work to an executor
+        act: async act(item, detections) -> True if it changed the scene (e.g. clicked an enemy)
+        timer: Optional instrumentation.StageTimer; one detection is one iteration of its main
+            loop, while capture and action have their own 'capture' and 'action' loops (one
+            captured frame / one act() call per iteration)
+        queue_size: Capacity of the frame and detection queues
+        report_interval: Seconds between printed queue metrics (0 = never)
+        retry_delay: Seconds to wait before restarting the frame source after an error; doubles
+            with every consecutive failure up to `max_retry_delay`
+
+    Detections computed from a frame captured before the last scene-changing action finished
+    are skipped, as they describe the scene before the action (a fight, say). Call stop() - or
+    send SIGINT/SIGTERM where the event loop supports signal handlers - to shut the pipeline
+    down cleanly.
+    """
+
+    def __init__(self, frame_source, detect, act, timer=None, queue_size=1, report_interval=30.0, retry_delay=1.0,
+                 max_retry_delay=30.0):
+        self.frame_source = frame_source
+        self.detect = detect
+        self.act = act
+        self.timer = timer
+        self.report_interval = report_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.frames = LatestQueue(queue_size)
+        self.detections = LatestQueue(queue_size)
+        self.stale_detections = 0
+        self.errors = 0
+        self._last_action_end = 0.0
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        """Asks every stage to finish; run() returns once they have."""
+        self._stop.set()
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+    def metrics(self):
+        """Queue depths and drop counts of the pipeline, for logging."""
+        return {
+            'frames': self.frames.metrics(),
+            'detections': self.detections.metrics(),
+            'stale_detections': self.stale_detections,
+            'errors': self.errors,
+        }
+
+    def print_metrics(self):
+        frames, detections = self.frames.metrics(), self.detections.metrics()
+        print(f"Pipeline: frame queue {frames['depth']} (max {frames['max_depth']}, {frames['dropped']} dropped), "
+              f"detection queue {detections['depth']} (max {detections['max_depth']}, {detections['dropped']} dropped), "
+              f"{self.stale_detections} stale detections skipped, {self.errors} errors")
+
+    async def run(self, duration=None):
+        """Runs until stop() is called, a signal arrives, the frame source ends or `duration` seconds pass."""
+        self._stop.clear()
+        loop = asyncio.get_running_loop()
+        handled_signals = []
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+                handled_signals.append(sig)
+            except (NotImplementedError, RuntimeError):  # Windows, or not the main thread
+                pass
+
+        tasks = [asyncio.create_task(coro) for coro in
+                 (self._capture_stage(), self._detection_stage(), self._action_stage())]
+        if self.report_interval:
+            tasks.append(asyncio.create_task(self._report_metrics()))
+        try:
+            if duration is None:
+                await self._stop.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), duration)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for sig in handled_signals:
+                loop.remove_signal_handler(sig)
+
+    async def _capture_stage(self):
+        with timed_loop(self.timer, 'capture'):
+            await self._capture_frames()
+        self.stop()
+
+    async def _capture_frames(self):
+        delay = self.retry_delay
+        while not self.stopping:
+            restartable = callable(self.frame_source)
+            source = self.frame_source() if restartable else self.frame_source
+            try:
+                async for item in source:
+                    self.frames.put((time.perf_counter(), item))
+                    if self.timer is not None:
+                        self.timer.end_iteration('capture')
+                    delay = self.retry_delay
+                    if self.stopping:
+                        break
+                break
+            except Exception as e:
+                self.errors += 1
+                if not restartable:
+                    print(f"Capture stopped after an error: {e}")
+                    break
+                # A page reload or a relog can fail a capture; keep the bot running
+                print(f"An error occurred during capture: {e}, retrying in {delay:.1f}s")
+                try:
+                    await asyncio.wait_for(self._stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, self.max_retry_delay)
+
+    async def _detection_stage(self):
+        while not self.stopping:
+            captured_at, item = await self.frames.get()
+            try:
+                detections = await self.detect(item)
+                self.detections.put((captured_at, item, detections))
+            except Exception as e:
+                print(f"An error occurred during detection: {e}")
+                self.errors += 1
+            if self.timer is not None:
+                self.timer.end_iteration()
+
+    async def _action_stage(self):
+        with timed_loop(self.timer, 'action'):
+            while not self.stopping:
+                captured_at, item, detections = await self.detections.get()
+                if captured_at < self._last_action_end:
+                    self.stale_detections += 1
+                    continue
+                try:
+                    with timed(self.timer, 'act'):
+                        acted = await self.act(item, detections)
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    self.errors += 1
+                    acted = True
+                if acted:
+                    self._last_action_end = time.perf_counter()
+                if self.timer is not None:
+                    self.timer.end_iteration('action')
+
+    async def _report_metrics(self):
+        while not self.stopping:
+            await asyncio.sleep(self.report_interval)
+            self.print_metrics()
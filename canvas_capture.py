@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import time
+import cv2
+import numpy as np
+from playwright.async_api import async_playwright
+from instrumentation import timed
+
+# Reads the raw RGBA pixels of a 2D canvas and returns them base64-encoded.
+# Returns null for WebGL canvases (no 2D context) so the caller can fall back.
+CANVAS_PIXELS_JS = """(selector) => {
+    const canvas = document.querySelector(selector);
+    if (!canvas) return null;
+    const ctx = canvas.getContext('2d');
+    if (!ctx) return null;
+    const data = ctx.getImageData(0, 0, canvas.width, canvas.height).data;
+    let binary = '';
+    const chunk = 0x8000;
+    for (let i = 0; i < data.length; i += chunk) {
+        binary += String.fromCharCode.apply(null, data.subarray(i, i + chunk));
+    }
+    return { width: canvas.width, height: canvas.height, data: btoa(binary) };
+}"""
+
+# Encodes the canvas as PNG inside the page, skipping the compositor screenshot.
+CANVAS_DATA_URL_JS = """(selector) => {
+    const canvas = document.querySelector(selector);
+    return canvas ? canvas.toDataURL('image/png') : null;
+}"""
+
+CAPTURE_METHODS = ('pixels', 'dataurl', 'screenshot')
+
+
+def decode_image_bytes(image_bytes):
+    """Decodes encoded image bytes (PNG/JPEG) into a BGR array without touching the disk."""
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+class CanvasFrameGrabber:
+    """
+    Grabs canvas frames from a Playwright page as BGR NumPy arrays.
+
+    The 'pixels' method reads the canvas backing store with getImageData and converts it into
+    a buffer that is reused between calls, so the returned array is only valid until the next
+    grab() - copy it if it has to outlive the frame. If a method fails (WebGL or tainted canvas)
+    the grabber falls back to the next one in CAPTURE_METHODS and stays there. Other errors,
+    such as a reload destroying the page's execution context, are raised without switching.
+
+    With a `timer` (instrumentation.StageTimer) the 'capture' and 'decode' stages are timed.
+    """
+
+    def __init__(self, page, selector='canvas', method='pixels', timer=None):
+        if method not in CAPTURE_METHODS:
+            raise ValueError(f"Unknown capture method {method!r}, expected one of {CAPTURE_METHODS}")
+        self.page = page
+        self.selector = selector
+        self.method = method
+        self.timer = timer
+        self._rgba = None
+        self._frame = None
+
+    async def grab(self):
+        """Returns the current canvas as a BGR array, or None if the canvas isn't on the page."""
+        while True:
+            try:
+                if self.method == 'pixels':
+                    return await self._grab_pixels()
+                if self.method == 'dataurl':
+                    return await self._grab_data_url()
+                canvas = await self.page.query_selector(self.selector)
+                if not canvas:
+                    return None
+                with timed(self.timer, 'capture'):
+                    image_bytes = await canvas.screenshot()
+                with timed(self.timer, 'decode'):
+                    return decode_image_bytes(image_bytes)
+            except _CaptureMethodUnavailable as e:
+                fallback = CAPTURE_METHODS[CAPTURE_METHODS.index(self.method) + 1]
+                print(f"Capture method '{self.method}' unavailable ({e}), falling back to '{fallback}'")
+                self.method = fallback
+
+    async def _grab_pixels(self):
+        try:
+            with timed(self.timer, 'capture'):
+                result = await self.page.evaluate(CANVAS_PIXELS_JS, self.selector)
+        except Exception as e:
+            _raise_if_tainted(e)
+            raise
+        if result is None:
+            if await self.page.query_selector(self.selector) is None:
+                return None
+            raise _CaptureMethodUnavailable("canvas has no 2D context")
+
+        with timed(self.timer, 'decode'):
+            width, height = result['width'], result['height']
+            raw = np.frombuffer(base64.b64decode(result['data']), dtype=np.uint8)
+
+            if self._frame is None or self._frame.shape[:2] != (height, width):
+                self._rgba = np.empty((height, width, 4), dtype=np.uint8)
+                self._frame = np.empty((height, width, 3), dtype=np.uint8)
+            self._rgba.reshape(-1)[:] = raw
+            cv2.cvtColor(self._rgba, cv2.COLOR_RGBA2BGR, dst=self._frame)
+        return self._frame
+
+    async def _grab_data_url(self):
+        try:
+            with timed(self.timer, 'capture'):
+                data_url = await self.page.evaluate(CANVAS_DATA_URL_JS, self.selector)
+        except Exception as e:
+            _raise_if_tainted(e)
+            raise
+        if data_url is None:
+            return None
+        with timed(self.timer, 'decode'):
+            frame = decode_image_bytes(base64.b64decode(data_url.split(',', 1)[1]))
+        if frame is None:
+            raise _CaptureMethodUnavailable("could not decode canvas data URL")
+        return frame
+
+
+class _CaptureMethodUnavailable(Exception):
+    pass
+
+
+def _raise_if_tainted(error):
+    """
+    Turns the SecurityError a tainted (cross-origin) canvas raises on readback into
+    _CaptureMethodUnavailable. Anything else - a navigation destroying the execution context,
+    a timeout - is transient and left for the caller to handle.
+    """
+    message = str(error)
+    if 'SecurityError' in message or 'tainted' in message:
+        raise _CaptureMethodUnavailable(message) from error
+
+
+class CaptureService:
+    """
+    Long-lived browser session for capturing the game: Chromium is launched once by start()
+    (or `async with`) and the same page is reused by every capture until stop(), so one-shot
+    commands and the bot loop don't pay for a browser launch per capture.
+
+    frames() yields canvas frames at up to `fps`. Frames are pulled, not buffered: a new frame
+    is grabbed only when the consumer asks for the next one, so a slow consumer always gets the
+    current canvas and the frames it had no time for are dropped (counted in `dropped_frames`)
+    instead of piling up.
+
+    Args:
+        headless: Run the browser without a window
+        selector: CSS selector of the game canvas
+        method: Preferred canvas capture method (see CAPTURE_METHODS)
+        timer: Optional instrumentation.StageTimer for the capture/decode stages
+    """
+
+    def __init__(self, headless=False, selector='canvas', method='pixels', timer=None):
+        self.headless = headless
+        self.selector = selector
+        self.method = method
+        self.timer = timer
+        self.page = None
+        self.grabber = None
+        self.captured_frames = 0
+        self.dropped_frames = 0
+        self._playwright = None
+        self._browser = None
+
+    async def start(self):
+        if self.page is not None:
+            return self
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        self.page = await self._browser.new_page()
+        self.grabber = CanvasFrameGrabber(self.page, self.selector, self.method, timer=self.timer)
+        return self
+
+    async def stop(self):
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self.page = self.grabber = self._browser = self._playwright = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def goto(self, url, wait_until='load', timeout=60000):
+        """
+        Navigates the page to `url`. The default waits for the load event only: the game keeps
+        its connection busy, so 'networkidle' can take the whole timeout.
+        """
+        await self.start()
+        print(f"Navigating to {url}...")
+        await self.page.goto(url, wait_until=wait_until, timeout=timeout)
+
+    async def open(self, url, **goto_options):
+        """goto(url) unless the page is already showing it, so a reused session keeps its state (e.g. login)."""
+        if self.page is None or self.page.url.rstrip('/') != url.rstrip('/'):
+            await self.goto(url, **goto_options)
+
+    async def wait_for_canvas(self, timeout=30000):
+        await self.page.wait_for_selector(self.selector, timeout=timeout)
+
+    async def grab(self):
+        """Returns the current canvas as a BGR array (reused buffer, see CanvasFrameGrabber), or None."""
+        frame = await self.grabber.grab()
+        if frame is not None:
+            self.captured_frames += 1
+        return frame
+
+    async def frames(self, fps=10.0, copy=False):
+        """
+        Async generator of canvas frames at up to `fps` frames per second. Missing canvases are
+        skipped. With copy=True every frame is a new array the consumer may keep; otherwise it is
+        only valid until the next frame is requested.
+        """
+        interval = 1.0 / fps if fps else 0.0
+        next_due = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now < next_due:
+                await asyncio.sleep(next_due - now)
+            elif interval:
+                # The consumer took longer than a frame interval: those frames are simply never grabbed
+                self.dropped_frames += int((now - next_due) / interval)
+            next_due = max(now, next_due) + interval
+            frame = await self.grab()
+            if frame is None:
+                continue
+            yield frame.copy() if copy else frame
+
+    async def save_canvas(self, output_filename):
+        """Saves the current canvas to an image file; returns False if there is no canvas."""
+        frame = await self.grab()
+        if frame is None:
+            return False
+        cv2.imwrite(output_filename, frame)
+        return True
+
+    async def screenshot(self, output_filename):
+        """Saves a screenshot of the whole page."""
+        await self.page.screenshot(path=output_filename)
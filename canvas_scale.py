@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+from template_bank import OPAQUE_MASK_SKIP, TemplateBank
+from template_matching import match_templates
+
+# Size of the canvas backing store, its rendered (CSS) box and the device pixel ratio.
+# Returns null when the canvas isn't on the page.
+CANVAS_GEOMETRY_JS = """(selector) => {
+    const canvas = document.querySelector(selector);
+    if (!canvas) return null;
+    const rect = canvas.getBoundingClientRect();
+    return {
+        width: canvas.width, height: canvas.height,
+        left: rect.left, top: rect.top, cssWidth: rect.width, cssHeight: rect.height,
+        devicePixelRatio: window.devicePixelRatio || 1,
+    };
+}"""
+
+# Scales tried by search_scale() when the frame's scale is unknown
+SEARCH_SCALES = (0.75, 1.0, 1.25, 1.5, 2.0)
+# Scales this close to 1 are matched as they are
+SCALE_TOLERANCE = 0.02
+
+# Template banks resampled to another scale, keyed by (bank version, scale)
+_scaled_banks = {}
+
+
+def estimate_scale(frame_shape, geometry):
+    """
+    Returns how many frame pixels one native sprite pixel covers, or None if it can't be told.
+
+    Sprites are drawn 1:1 into the canvas backing store (`width` x `height`), so a frame read
+    from the backing store has scale 1. A screenshot of the rendered canvas is
+    cssWidth * devicePixelRatio pixels wide instead, so browser zoom, high-DPI screens and CSS
+    resizing all show up as frame size / backing store size.
+    """
+    if not geometry or not geometry.get('width') or not geometry.get('height'):
+        return None
+    frame_h, frame_w = frame_shape[:2]
+    return (frame_w / geometry['width'] + frame_h / geometry['height']) / 2
+
+
+def frame_to_page(x, y, frame_shape, geometry):
+    """Maps a frame pixel to page (CSS) coordinates for mouse clicks, using the canvas' rendered box."""
+    if not geometry or not geometry.get('cssWidth') or not geometry.get('cssHeight'):
+        return x, y
+    frame_h, frame_w = frame_shape[:2]
+    return (geometry['left'] + x * geometry['cssWidth'] / frame_w,
+            geometry['top'] + y * geometry['cssHeight'] / frame_h)
+
+
+def is_native(scale):
+    return scale is None or abs(scale - 1.0) <= SCALE_TOLERANCE
+
+
+def resample_to_native(canvas_image, scale):
+    """Resizes a frame by 1 / `scale` so its sprites have their native pixel size."""
+    if is_native(scale):
+        return canvas_image
+    height, width = canvas_image.shape[:2]
+    size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    # Area averaging when shrinking avoids aliasing; enlarging interpolates
+    interpolation = cv2.INTER_AREA if scale > 1 else cv2.INTER_LINEAR
+    return cv2.resize(canvas_image, size, interpolation=interpolation)
+
+
+def scale_detections(detections, scale):
+    """Maps detections made on a native-scale frame back to the coordinates of the original frame."""
+    if is_native(scale):
+        return detections
+    scaled = []
+    for detection in detections:
+        x, y = detection['position']
+        scaled.append({**detection, 'position': (int(round(x * scale)), int(round(y * scale))),
+                       'width': int(round(detection['width'] * scale)),
+                       'height': int(round(detection['height'] * scale))})
+    return scaled
+
+
+def scaled_bank(bank, scale):
+    """
+    Returns `bank` with every template (and mask) resized by `scale`, built on first use and
+    cached per scale, so matching at another scale doesn't resample the frame.
+    """
+    if is_native(scale):
+        return bank
+    key = (bank.version, round(scale, 3))
+    scaled = _scaled_banks.get(key)
+    if scaled is None:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        templates, masks = [], []
+        for i in range(len(bank)):
+            h, w = bank.shapes[i]
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            templates.append(cv2.resize(bank[i], size, interpolation=interpolation))
+            mask = bank.mask(i)
+            if mask is not None:
+                # Nearest neighbour keeps the mask binary
+                mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+                mask = mask if np.count_nonzero(mask) < OPAQUE_MASK_SKIP * mask.size else None
+            masks.append(mask)
+        scaled = TemplateBank.from_templates(bank.filenames, templates, bank.template_dir, bank.frame_indices, masks)
+        _scaled_banks[key] = scaled
+    return scaled
+
+
+def search_scale(canvas_gray, bank, threshold=0.7, mode='exhaustive', scales=SEARCH_SCALES, top=3, **match_options):
+    """
+    Matches the bank at each of `scales` (using scaled_bank) and returns (scale, detections) for
+    the scale with the best detections, or (None, []) if no scale found anything. Costs one full
+    scan per scale, so callers should keep the scale found.
+
+    Scales are ranked by the mean confidence of their `top` best detections, not by how many
+    there are: at the right scale sprites match almost perfectly, while a wrong scale (small
+    ones especially) tends to produce many matches just above the threshold.
+    """
+    best_scale, best_detections, best_score = None, [], 0.0
+    for scale in scales:
+        detections = match_templates(canvas_gray, scaled_bank(bank, scale), threshold, mode, **match_options)
+        if not detections:
+            continue
+        # Detections come sorted by confidence
+        score = float(np.mean([d['confidence'] for d in detections[:top]]))
+        if score > best_score:
+            best_scale, best_detections, best_score = scale, detections, score
+    return best_scale, best_detections
@@ -1,97 +1,82 @@
 import cv2
 import numpy as np
 import os
-from PIL import Image
 import argparse
+import csv
+import functools
+import glob
+import json
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from template_bank import TemplateBank, get_template_bank
+from template_matching import (EXECUTOR_KINDS, MATCH_MODES, compare_recall, init_process_worker, match_templates,
+                               match_threshold_sweep, measure_worker_throughput, process_worker_bank)
+from fft_matching import check_fft_equivalence
 
-def debug_template_matching(canvas_path, template_dir, output_path="debug_result.png", threshold=0.7):
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+CSV_FIELDS = ('image', 'threshold', 'name', 'filename', 'frame', 'x', 'y', 'width', 'height', 'confidence')
+
+def draw_matches(canvas_img, matches, threshold):
+    """Returns a copy of the canvas with a labelled rectangle around every match."""
+    visualization = canvas_img.copy()
+    for match in matches:
+        filename = match['filename']
+        pt = match['position']
+        
+        # Generate random color for this template type (consistent for same template)
+        color_hash = hash(filename) % 255
+        color = (color_hash, (color_hash + 85) % 255, (color_hash + 170) % 255)
+        
+        # Draw rectangle
+        cv2.rectangle(visualization, pt, (pt[0] + match['width'], pt[1] + match['height']), color, 2)
+        
+        # Add text label with enemy name and confidence
+        enemy_name = os.path.splitext(filename)[0]
+        label = f"{enemy_name}#{match['frame']} ({match['confidence']:.2f})"
+        cv2.putText(visualization, label, (pt[0], pt[1] - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    
+    # Add threshold information to the image
+    threshold_text = f"Threshold: {threshold}"
+    cv2.putText(visualization, threshold_text, (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+    return visualization
+
+def debug_template_matching(canvas_path, templates, output_path="debug_result.png", threshold=0.7,
+                            mode="exhaustive", **match_options):
     """
     Visualize template matching results by drawing rectangles around detected enemies.
     
     Args:
-        canvas_path: Path to the canvas screenshot
-        template_dir: Directory containing enemy templates
+        canvas_path: Path to the canvas screenshot (or the frame itself as a BGR array)
+        templates: TemplateBank or directory containing enemy templates
         output_path: Path to save the visualization result
         threshold: Matching threshold (0.0 to 1.0)
+        mode: Matching engine, one of MATCH_MODES ('exhaustive', 'pyramid' or 'fft')
+        match_options: Extra options for the matching engine (e.g. coarse_margin)
     """
     # Read the canvas screenshot
-    canvas_img = cv2.imread(canvas_path)
+    canvas_img = canvas_path if isinstance(canvas_path, np.ndarray) else cv2.imread(canvas_path)
     if canvas_img is None:
         print(f"Error: Could not read canvas screenshot at {canvas_path}")
         return
     
-    # Make a copy for visualization
-    visualization = canvas_img.copy()
     canvas_gray = cv2.cvtColor(canvas_img, cv2.COLOR_BGR2GRAY)
     
-    print(f"Looking for templates in {template_dir}...")
-    found_count = 0
+    print(f"Matching templates from {getattr(templates, 'template_dir', templates)}...")
+    bank = templates if isinstance(templates, TemplateBank) else get_template_bank(templates)
     
-    # Loop through all enemy templates
-    for filename in os.listdir(template_dir):
-        if not (filename.endswith('.png') or filename.endswith('.gif') or filename.endswith('.jpg')):
-            continue
-            
-        template_path = os.path.join(template_dir, filename)
-        
-        # For GIF files, we need to extract the first frame
-        if filename.endswith('.gif'):
-            try:
-                with Image.open(template_path) as img:
-                    img_array = np.array(img.convert('RGB'))
-                    template_img = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            except Exception as e:
-                print(f"Error processing GIF {filename}: {e}")
-                continue
-        else:
-            # For PNG/JPG, read directly
-            template_img = cv2.imread(template_path)
-            
-        if template_img is None:
-            print(f"Could not read template {filename}")
-            continue
-            
-        # Convert template to grayscale
-        template_gray = cv2.cvtColor(template_img, cv2.COLOR_BGR2GRAY)
-        template_w, template_h = template_gray.shape[::-1]
-        
-        # Apply template matching
-        res = cv2.matchTemplate(canvas_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-        
-        # Get positions where match exceeds threshold
-        loc = np.where(res >= threshold)
-        match_count = 0
-        
-        # Draw rectangles and labels for this template
-        for pt in zip(*loc[::-1]):  # Switch columns and rows
-            match_count += 1
-            found_count += 1
-            
-            # Get the match confidence at this point
-            confidence = res[pt[1], pt[0]]
-            
-            # Generate random color for this template type (consistent for same template)
-            color_hash = hash(filename) % 255
-            color = (color_hash, (color_hash + 85) % 255, (color_hash + 170) % 255)
-            
-            # Draw rectangle
-            cv2.rectangle(visualization, pt, (pt[0] + template_w, pt[1] + template_h), color, 2)
-            
-            # Add text label with enemy name and confidence
-            enemy_name = os.path.splitext(filename)[0]
-            label = f"{enemy_name} ({confidence:.2f})"
-            cv2.putText(visualization, label, (pt[0], pt[1] - 5), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
-            
-        if match_count > 0:
-            print(f"Found {match_count} matches for {filename}")
+    matches = match_templates(canvas_gray, bank, threshold, mode=mode, **match_options)
+    found_count = len(matches)
+    match_counts = Counter(match['filename'] for match in matches)
+    
+    for filename, match_count in sorted(match_counts.items()):
+        print(f"Found {match_count} matches for {filename}")
     
     print(f"Total matches found: {found_count}")
     
-    # Add threshold information to the image
-    threshold_text = f"Threshold: {threshold}"
-    cv2.putText(visualization, threshold_text, (10, 30), 
-                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+    visualization = draw_matches(canvas_img, matches, threshold)
     
     # Save the visualization
     cv2.imwrite(output_path, visualization)
@@ -99,21 +84,199 @@ def debug_template_matching(canvas_path, template_dir, output_path="debug_result
     
     return visualization
 
+def find_batch_images(pattern):
+    """Returns the image files in a directory, or the files matching a glob pattern, sorted."""
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+def analyze_image(image_path, bank, thresholds, mode="exhaustive", annotate_dir=None, **match_options):
+    """
+    Matches one screenshot for every threshold in `thresholds` (see match_threshold_sweep) and
+    returns a dict with 'image', 'seconds', 'error' and 'detections' ({threshold: matches}).
+    With `annotate_dir`, an annotated copy is written there for each threshold.
+    """
+    canvas_img = cv2.imread(image_path)
+    if canvas_img is None:
+        return {'image': image_path, 'seconds': 0.0, 'error': "could not read image", 'detections': {}}
+    
+    start = time.perf_counter()
+    sweep = match_threshold_sweep(cv2.cvtColor(canvas_img, cv2.COLOR_BGR2GRAY), bank, thresholds, mode,
+                                  **match_options)
+    seconds = time.perf_counter() - start
+    
+    if annotate_dir:
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        for threshold, matches in sweep.items():
+            suffix = f"_t{threshold:.2f}" if len(sweep) > 1 else ""
+            cv2.imwrite(os.path.join(annotate_dir, f"{stem}{suffix}.png"), draw_matches(canvas_img, matches, threshold))
+    return {'image': image_path, 'seconds': seconds, 'error': None, 'detections': sweep}
+
+def _analyze_image_in_process(image_path, **options):
+    return analyze_image(image_path, process_worker_bank(), **options)
+
+def _write_batch_result(result, writer, csv_output):
+    if result['error']:
+        if not csv_output:
+            writer.write(json.dumps({'image': result['image'], 'error': result['error']}) + "\n")
+        return
+    for threshold, matches in result['detections'].items():
+        if not csv_output:
+            writer.write(json.dumps({'image': result['image'], 'threshold': threshold, 'seconds': result['seconds'],
+                                     'detections': matches}) + "\n")
+            continue
+        for match in matches:
+            writer.writerow({'image': result['image'], 'threshold': threshold, 'name': match['name'],
+                             'filename': match['filename'], 'frame': match['frame'],
+                             'x': match['position'][0], 'y': match['position'][1], 'width': match['width'],
+                             'height': match['height'], 'confidence': round(match['confidence'], 4)})
+
+def debug_template_matching_batch(pattern, templates, results_path, thresholds=(0.7,), mode="exhaustive",
+                                  processes=1, annotate_dir=None, **match_options):
+    """
+    Runs template matching over many screenshots and streams the detections to a file.
+    
+    Args:
+        pattern: Directory of screenshots or a glob pattern (e.g. "recordings/**/*.png")
+        templates: TemplateBank or directory containing enemy templates (loaded once)
+        results_path: Output file; ".csv" writes one row per detection, anything else JSON lines
+            (one line per image and threshold)
+        thresholds: Thresholds to report; each image is matched once for all of them
+        mode: Matching engine, one of MATCH_MODES
+        processes: Worker processes the images are spread across (each holds a copy of the bank)
+        annotate_dir: Optional directory for annotated copies of the screenshots
+        match_options: Extra options for the matching engine (e.g. coarse_margin)
+    
+    Returns per-threshold totals: {threshold: {'images', 'detections'}}.
+    """
+    image_paths = find_batch_images(pattern)
+    if not image_paths:
+        print(f"No images found for {pattern}")
+        return {}
+    bank = templates if isinstance(templates, TemplateBank) else get_template_bank(templates)
+    thresholds = sorted(set(thresholds))
+    if annotate_dir:
+        os.makedirs(annotate_dir, exist_ok=True)
+    print(f"Matching {len(image_paths)} images against {len(bank)} templates at thresholds {thresholds}...")
+    
+    options = dict(thresholds=thresholds, mode=mode, annotate_dir=annotate_dir, **match_options)
+    pool = None
+    if processes <= 1:
+        results = (analyze_image(path, bank, **options) for path in image_paths)
+    else:
+        # The bank is sent to each worker once; images are read by the workers themselves
+        pool = ProcessPoolExecutor(max_workers=processes, initializer=init_process_worker, initargs=(bank,))
+        results = pool.map(functools.partial(_analyze_image_in_process, **options), image_paths)
+    
+    totals = {threshold: {'images': 0, 'detections': 0} for threshold in thresholds}
+    csv_output = results_path.lower().endswith(".csv")
+    start = time.perf_counter()
+    try:
+        with open(results_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS) if csv_output else f
+            if csv_output:
+                writer.writeheader()
+            # Results are written as they arrive (in input order), so partial runs are usable
+            for done, result in enumerate(results, 1):
+                _write_batch_result(result, writer, csv_output)
+                f.flush()
+                if result['error']:
+                    print(f"Skipped {result['image']}: {result['error']}")
+                for threshold, matches in result['detections'].items():
+                    totals[threshold]['images'] += 1
+                    totals[threshold]['detections'] += len(matches)
+                if done % 50 == 0:
+                    print(f"Processed {done}/{len(image_paths)} images")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(image_paths)} images in {elapsed:.1f}s ({elapsed / len(image_paths):.2f}s per image)")
+    for threshold, total in totals.items():
+        mean = total['detections'] / total['images'] if total['images'] else 0.0
+        print(f"Threshold {threshold:.2f}: {total['detections']} detections ({mean:.1f} per image)")
+    print(f"Results saved to {results_path}")
+    return totals
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Debug template matching for enemy detection")
     parser.add_argument("--canvas", default="canvas.png", help="Path to the canvas screenshot")
     parser.add_argument("--templates", default="templates/enemies", help="Directory containing enemy templates")
     parser.add_argument("--output", default="debug_result.png", help="Path to save visualization result")
     parser.add_argument("--threshold", type=float, default=0.7, help="Matching threshold (0.0 to 1.0)")
+    parser.add_argument("--mode", choices=MATCH_MODES, default="exhaustive", help="Matching engine")
+    parser.add_argument("--pyramid-levels", type=int, default=1, help="Pyramid mode: how many times the canvas is halved for the coarse pass")
+    parser.add_argument("--coarse-margin", type=float, default=0.15, help="Pyramid mode: how far below the threshold coarse candidates are kept (higher = better recall, slower)")
+    parser.add_argument("--no-masks", action="store_true", help="Match full template rectangles, ignoring transparency")
+    parser.add_argument("--workers", type=int, default=1, help="Number of workers the templates are sharded across")
+    parser.add_argument("--executor", choices=EXECUTOR_KINDS, default="thread", help="Pool type used when --workers > 1")
+    parser.add_argument("--benchmark-workers", help="Comma-separated worker counts (e.g. 1,2,4) to report matching throughput for, then exit")
+    parser.add_argument("--compare-recall", action="store_true", help="Compare the pyramid matcher against the exhaustive one and exit")
+    parser.add_argument("--check-fft", action="store_true", help="Check that the fft matcher's scores equal the exhaustive ones and exit")
+    parser.add_argument("--batch", help="Directory or glob of screenshots to analyse offline instead of --canvas")
+    parser.add_argument("--results", default="debug_results.jsonl", help="Batch mode: detections file (.jsonl, or .csv)")
+    parser.add_argument("--thresholds", help="Batch mode: comma-separated thresholds to sweep (default: --threshold)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Batch mode: worker processes")
+    parser.add_argument("--annotate-dir", help="Batch mode: also save annotated screenshots to this directory")
     
     args = parser.parse_args()
+    pyramid_options = {"pyramid_levels": args.pyramid_levels, "coarse_margin": args.coarse_margin}
+    mode_options = dict(pyramid_options) if args.mode == "pyramid" else {}
+    mode_options["use_masks"] = not args.no_masks
+    
+    if args.benchmark_workers:
+        canvas_img = cv2.imread(args.canvas)
+        if canvas_img is None:
+            raise SystemExit(f"Error: Could not read canvas screenshot at {args.canvas}")
+        worker_counts = [int(n) for n in args.benchmark_workers.split(",")]
+        report = measure_worker_throughput(cv2.cvtColor(canvas_img, cv2.COLOR_BGR2GRAY), get_template_bank(args.templates),
+                                           worker_counts, args.threshold, args.mode, args.executor, **mode_options)
+        for row in report:
+            print(f"{row['workers']:>3} {row['executor']} workers: {row['seconds_per_frame'] * 1000:8.1f} ms/frame, "
+                  f"{row['templates_per_second']:8.0f} templates/s")
+        raise SystemExit(0)
+    
+    if args.compare_recall:
+        canvas_img = cv2.imread(args.canvas)
+        if canvas_img is None:
+            raise SystemExit(f"Error: Could not read canvas screenshot at {args.canvas}")
+        report = compare_recall(cv2.cvtColor(canvas_img, cv2.COLOR_BGR2GRAY), get_template_bank(args.templates),
+                                args.threshold, **pyramid_options)
+        print(f"Exhaustive: {report['exhaustive_matches']} matches in {report['exhaustive_seconds']:.3f}s")
+        print(f"Pyramid:    {report['pyramid_matches']} matches in {report['pyramid_seconds']:.3f}s "
+              f"({report['speedup']:.1f}x faster)")
+        print(f"Recall of pyramid vs exhaustive: {report['recall']:.3f}")
+        raise SystemExit(0)
+    
+    if args.check_fft:
+        canvas_img = cv2.imread(args.canvas)
+        if canvas_img is None:
+            raise SystemExit(f"Error: Could not read canvas screenshot at {args.canvas}")
+        report = check_fft_equivalence(cv2.cvtColor(canvas_img, cv2.COLOR_BGR2GRAY), get_template_bank(args.templates),
+                                       use_masks=not args.no_masks)
+        print(f"Compared {report['templates']} templates: largest score difference {report['max_abs_difference']:.2e}"
+              + (f" ({report['worst_template']})" if report['worst_template'] else ""))
+        raise SystemExit(0 if report['max_abs_difference'] < 1e-3 else 1)
+    
+    if args.batch:
+        thresholds = [float(t) for t in args.thresholds.split(",")] if args.thresholds else [args.threshold]
+        debug_template_matching_batch(args.batch, args.templates, args.results, thresholds, args.mode,
+                                      processes=args.processes, annotate_dir=args.annotate_dir, **mode_options)
+        raise SystemExit(0)
     
     # Run the debug visualization
     result = debug_template_matching(
         args.canvas, 
         args.templates, 
         args.output, 
-        args.threshold
+        args.threshold,
+        args.mode,
+        workers=args.workers,
+        executor=args.executor,
+        **mode_options
     )
     
     # Display the result if running in an environment with display
@@ -0,0 +1,100 @@
+import hashlib
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+def frame_hash(canvas_gray, downsample=4):
+    """
+    Fast content hash of a frame: blake2b of the frame shrunk `downsample` times by area
+    averaging. Identical frames always hash the same; downsample=1 hashes every pixel, larger
+    factors are cheaper but may ignore changes too faint to move an averaged pixel.
+    """
+    if downsample > 1:
+        height, width = canvas_gray.shape[:2]
+        canvas_gray = cv2.resize(canvas_gray, (max(1, width // downsample), max(1, height // downsample)),
+                                 interpolation=cv2.INTER_AREA)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.asarray(canvas_gray.shape, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(canvas_gray).tobytes())
+    return digest.hexdigest()
+
+
+def _option_key(value):
+    # Template subsets arrive as lists or arrays; make them hashable
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(int(v) for v in value)
+    return value
+
+
+class DetectionCache:
+    """
+    LRU cache of detection results keyed by frame content, so an unchanged canvas (idle
+    character, no redraw since the last capture) doesn't pay for a template scan again.
+
+    A key combines frame_hash() with the bank version, threshold, matcher mode, match options
+    and the colour proposal index used, if any (proposal-guided results can miss sprites a full
+    scan finds, so they never stand in for each other). Entries from an older bank or another threshold can never be hit again, so when
+    either changes the whole cache is dropped (counted in `invalidations`).
+
+    Args:
+        max_entries: Results kept before the least recently used one is evicted
+        downsample: Passed to frame_hash()
+    """
+
+    def __init__(self, max_entries=32, downsample=4):
+        self.max_entries = max_entries
+        self.downsample = downsample
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._context = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, canvas_gray, bank, threshold, mode, proposal_index=None, **match_options):
+        """Returns the cache key of a frame; clears the cache first if the bank or threshold changed."""
+        context = (bank.version, threshold)
+        if context != self._context:
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+            self._context = context
+        options = tuple(sorted((name, _option_key(value)) for name, value in match_options.items()
+                               if name not in ('workers', 'executor', 'profiler')))
+        proposals = id(proposal_index) if proposal_index is not None else None
+        return frame_hash(canvas_gray, self.downsample), mode, proposals, options
+
+    def get(self, key):
+        """Returns the cached detections for `key` (as a new list), or None on a miss."""
+        results = self._entries.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(results)
+
+    def put(self, key, results):
+        self._entries[key] = list(results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
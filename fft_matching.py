@@ -0,0 +1,145 @@
+import cv2
+import numpy as np
+
+# Masked windows whose canvas variance (per opaque pixel) is below this are treated as flat and
+# score 0 in both engines (see zero_flat_windows). That is a standard deviation of a tenth of a
+# grey level: OpenCV still scores such windows, but only from pixels a single step apart, and
+# their variance is too close to the engines' rounding error for the scores to agree.
+FLAT_VARIANCE = 1e-2
+
+
+class CanvasSpectrum:
+    """
+    Everything about one canvas that template correlation needs, computed once per frame and
+    shared by every template: the DFTs of the canvas and of its squared pixels, and integral
+    images (running sums) of both.
+
+    All templates are correlated at the same DFT size - the canvas size rounded up to a fast
+    DFT length - since a 'valid' correlation never wraps around a buffer the size of the canvas.
+    """
+
+    def __init__(self, canvas_gray):
+        self.shape = canvas_gray.shape[:2]
+        height, width = self.shape
+        self.dft_shape = (cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width))
+
+        canvas = canvas_gray.astype(np.float64)
+        padded = np.zeros(self.dft_shape, dtype=np.float64)
+        padded[:height, :width] = canvas
+        self.canvas_dft = cv2.dft(padded, nonzeroRows=height)
+        padded[:height, :width] = canvas * canvas
+        self.squares_dft = cv2.dft(padded, nonzeroRows=height)
+        self.sums, self.square_sums = cv2.integral2(canvas_gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+    def kernel_dft(self, kernel):
+        """DFT of a float64 kernel (no larger than the canvas) zero-padded to dft_shape."""
+        kernel_h, kernel_w = kernel.shape
+        padded = np.zeros(self.dft_shape, dtype=np.float64)
+        padded[:kernel_h, :kernel_w] = kernel
+        return cv2.dft(padded, nonzeroRows=kernel_h)
+
+    def correlate(self, kernel_dft, kernel_shape, spectrum=None):
+        """
+        'Valid' cross-correlation of the canvas (or of the squared canvas, when `spectrum` is
+        squares_dft) with a kernel of `kernel_shape`, given the kernel's kernel_dft().
+        """
+        valid_h, valid_w = self.shape[0] - kernel_shape[0] + 1, self.shape[1] - kernel_shape[1] + 1
+        product = cv2.mulSpectrums(self.canvas_dft if spectrum is None else spectrum, kernel_dft, 0, conjB=True)
+        result = cv2.idft(product, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE, nonzeroRows=valid_h)
+        return result[:valid_h, :valid_w]
+
+    def window_sums(self, template_shape):
+        """Sums of the canvas pixels and of their squares over every template-sized window."""
+        template_h, template_w = template_shape
+        valid_h, valid_w = self.shape[0] - template_h + 1, self.shape[1] - template_w + 1
+
+        def box(table):
+            return (table[template_h:template_h + valid_h, template_w:template_w + valid_w]
+                    - table[:valid_h, template_w:template_w + valid_w]
+                    - table[template_h:template_h + valid_h, :valid_w]
+                    + table[:valid_h, :valid_w])
+
+        return box(self.sums), box(self.square_sums)
+
+
+def zero_flat_windows(canvas_variance, count):
+    """
+    Zeroes, in place, the masked-window variances (sums over `count` opaque pixels) below
+    FLAT_VARIANCE per pixel, so normalize_scores scores those windows 0. Shared by the spatial
+    and FFT engines so both treat the same windows as flat.
+    """
+    canvas_variance[canvas_variance < FLAT_VARIANCE * count] = 0
+    return canvas_variance
+
+
+def normalize_scores(numerator, canvas_variance, template_norm):
+    """Divides like OpenCV's matchTemplate does, including its handling of flat windows."""
+    denominator = np.sqrt(np.maximum(canvas_variance, 0)) * template_norm
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = (numerator / denominator).astype(np.float32)
+    # Rounding can push a perfect match just past 1; flat windows (0/0) score 0
+    outside = ~(np.abs(res) < 1)
+    if outside.any():
+        values = res[outside]
+        res[outside] = np.where(np.abs(values) < 1.125, np.sign(values), 0)
+    return res
+
+
+def fft_match_template(spectrum, template_gray, mask=None):
+    """
+    TM_CCOEFF_NORMED response map of one template computed in the frequency domain; the same
+    scores as template_matching.match_template up to floating-point error.
+
+    With a mask the template is centred on its opaque pixels only, and the canvas mean and
+    variance under the mask come from correlating the canvas and its squares with the mask.
+    Without one, the window sums come straight from the integral images.
+    """
+    template = template_gray.astype(np.float64)
+    if mask is None:
+        count = template.size
+        template = template - template.mean()
+        numerator = spectrum.correlate(spectrum.kernel_dft(template), template.shape)
+        sums, square_sums = spectrum.window_sums(template.shape)
+        canvas_variance = square_sums - sums * sums / count
+    else:
+        weights = (mask > 0).astype(np.float64)
+        count = weights.sum()
+        template = (template - (template * weights).sum() / count) * weights
+        numerator = spectrum.correlate(spectrum.kernel_dft(template), template.shape)
+        # One DFT of the mask serves both window sums
+        weights_dft = spectrum.kernel_dft(weights)
+        sums = spectrum.correlate(weights_dft, weights.shape)
+        square_sums = spectrum.correlate(weights_dft, weights.shape, spectrum.squares_dft)
+        canvas_variance = zero_flat_windows(square_sums - sums * sums / count, count)
+
+    template_norm = np.sqrt((template * template).sum())
+    return normalize_scores(numerator, canvas_variance, template_norm)
+
+
+def check_fft_equivalence(canvas_gray, bank, template_indices=None, use_masks=True):
+    """
+    Compares fft_match_template with the spatial matcher (template_matching.match_template)
+    for each template and returns the largest absolute score difference found, plus how many
+    templates were compared. Windows the FFT engine scores 0 (flat canvas) are left out.
+    """
+    from template_matching import match_template
+
+    spectrum = CanvasSpectrum(canvas_gray)
+    indices = range(len(bank)) if template_indices is None else template_indices
+    max_difference = 0.0
+    worst = None
+    compared = 0
+    for i in indices:
+        template_gray = bank[i]
+        if template_gray.shape[0] > canvas_gray.shape[0] or template_gray.shape[1] > canvas_gray.shape[1]:
+            continue
+        mask = bank.mask(i) if use_masks else None
+        expected = match_template(canvas_gray, template_gray, mask)
+        actual = fft_match_template(spectrum, template_gray, mask)
+        defined = actual != 0
+        if defined.any():
+            difference = float(np.abs(expected[defined] - actual[defined]).max())
+            if difference > max_difference:
+                max_difference, worst = difference, bank.filenames[i]
+        compared += 1
+    return {'templates': compared, 'max_abs_difference': max_difference, 'worst_template': worst}
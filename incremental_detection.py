@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+from template_matching import match_templates, suppress_overlapping_results
+
+
+def _rects_overlap(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def merge_rects(rects):
+    """Merges overlapping (x, y, w, h) rectangles until no two of them overlap."""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                if _rects_overlap(rects[i], rects[j]):
+                    a, b = rects[i], rects.pop(j)
+                    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+                    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+                    rects[i] = [x0, y0, x1 - x0, y1 - y0]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in rects]
+
+
+def find_dirty_rects(previous_gray, current_gray, diff_threshold=12, cell_size=8):
+    """
+    Returns the (x, y, w, h) rectangles where two frames differ. The difference mask is pooled
+    into cell_size x cell_size cells first, so single noisy pixels don't create many tiny regions.
+    """
+    changed = cv2.absdiff(previous_gray, current_gray) > diff_threshold
+    h, w = changed.shape
+    padded = np.zeros((-(-h // cell_size) * cell_size, -(-w // cell_size) * cell_size), dtype=bool)
+    padded[:h, :w] = changed
+    cells = padded.reshape(padded.shape[0] // cell_size, cell_size, -1, cell_size).any(axis=(1, 3))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(cells.astype(np.uint8), connectivity=8)
+    rects = []
+    for x, y, cw, ch, _ in stats[1:count]:
+        x0, y0 = x * cell_size, y * cell_size
+        rects.append((x0, y0, min(cw * cell_size, w - x0), min(ch * cell_size, h - y0)))
+    return rects
+
+
+class IncrementalDetector:
+    """
+    Keeps the previous frame and its detections and, for each new frame, re-runs template
+    matching only around the pixels that changed. Every dirty rectangle is grown by the largest
+    template size, so any sprite touching a change lies fully inside a searched region;
+    detections that don't touch a change are carried forward unchanged.
+
+    A full rescan happens on the first frame, when the canvas size changes, when more than
+    `max_dirty_fraction` of the canvas changed (e.g. the map scrolled) and every
+    `full_rescan_interval` frames to correct drift.
+    """
+
+    def __init__(self, bank, threshold=0.7, full_rescan_interval=30, diff_threshold=12,
+                 max_dirty_fraction=0.5, **match_options):
+        self.bank = bank
+        self.threshold = threshold
+        self.full_rescan_interval = full_rescan_interval
+        self.diff_threshold = diff_threshold
+        self.max_dirty_fraction = max_dirty_fraction
+        self.match_options = match_options
+        self.margin = int(bank.shapes.max()) if len(bank) else 0
+        self.previous_gray = None
+        self.detections = []
+        self.frames_since_full_scan = 0
+        # Details of the last detect() call, for logging
+        self.last_scan = None
+
+    def reset(self):
+        """Forgets the previous frame so the next call does a full rescan."""
+        self.previous_gray = None
+        self.detections = []
+
+    def set_template_indices(self, template_indices):
+        """
+        Restricts matching to a subset of the bank (None = all templates). Narrowing the subset
+        only drops the carried-forward detections of removed templates; adding templates
+        invalidates them, so the next frame gets a full rescan.
+        """
+        current = self.match_options.get('template_indices')
+        if template_indices is not None:
+            template_indices = sorted(int(i) for i in template_indices)
+        if template_indices == current:
+            return
+        self.match_options['template_indices'] = template_indices
+        if template_indices is not None and (current is None or set(template_indices) <= set(current)):
+            kept = {(self.bank.filenames[i], int(self.bank.frame_indices[i])) for i in template_indices}
+            self.detections = [d for d in self.detections if (d['filename'], d['frame']) in kept]
+        else:
+            self.reset()
+
+    def detect(self, canvas_image):
+        """Returns the detections for a BGR or grayscale frame (same dicts as match_templates)."""
+        if canvas_image.ndim == 3:
+            canvas_gray = cv2.cvtColor(canvas_image, cv2.COLOR_BGR2GRAY)
+        else:
+            # Copy, as frame grabbers may reuse the buffer we are handed
+            canvas_gray = canvas_image.copy()
+
+        dirty = None
+        if (self.previous_gray is not None
+                and self.previous_gray.shape == canvas_gray.shape
+                and self.frames_since_full_scan < self.full_rescan_interval):
+            dirty = find_dirty_rects(self.previous_gray, canvas_gray, self.diff_threshold)
+            dirty_area = sum(w * h for _, _, w, h in dirty)
+            if dirty_area > self.max_dirty_fraction * canvas_gray.size:
+                dirty = None
+
+        if dirty is None:
+            self.detections = match_templates(canvas_gray, self.bank, self.threshold, **self.match_options)
+            self.frames_since_full_scan = 0
+            self.last_scan = {'full': True, 'regions': 1, 'searched_fraction': 1.0}
+        else:
+            self.frames_since_full_scan += 1
+            carried = [d for d in self.detections
+                       if not any(_rects_overlap((*d['position'], d['width'], d['height']), r) for r in dirty)]
+            searched = merge_rects([(x - self.margin, y - self.margin, w + 2 * self.margin, h + 2 * self.margin)
+                                    for x, y, w, h in dirty])
+            fresh = match_templates(canvas_gray, self.bank, self.threshold, regions=searched,
+                                    **self.match_options) if searched else []
+            # A sprite near a change can be found again by the fresh pass; keep one detection
+            self.detections = suppress_overlapping_results(carried + fresh, self.match_options.get('nms_iou', 0.3))
+            searched_area = sum(_clipped_area(r, canvas_gray.shape) for r in searched)
+            self.last_scan = {'full': False, 'regions': len(searched),
+                              'searched_fraction': float(searched_area / canvas_gray.size)}
+
+        self.previous_gray = canvas_gray
+        return self.detections
+
+
+def _clipped_area(rect, shape):
+    x, y, w, h = rect
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, shape[1]), min(y + h, shape[0])
+    return max(0, x1 - x0) * max(0, y1 - y0)
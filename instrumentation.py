@@ -0,0 +1,159 @@
+import contextvars
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+# Upper bucket edges (ms) of the latency histograms in summaries
+HISTOGRAM_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Loop that stages belong to unless recorded inside StageTimer.loop()
+MAIN_LOOP = 'main'
+
+
+def timed(timer, name):
+    """timer.stage(name) if a timer is given, otherwise a no-op context manager."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+def timed_loop(timer, name):
+    """timer.loop(name) if a timer is given, otherwise a no-op context manager."""
+    return timer.loop(name) if timer is not None else nullcontext()
+
+
+class StageTimer:
+    """
+    Lightweight timing of the bot loop. Stages are timed with `with timer.stage('capture'):`
+    and kept in a rolling window of the last `window` samples per stage; end_iteration() closes
+    one loop iteration, optionally appends it as a JSON line to `jsonl_path`, and prints a
+    summary every `report_interval` seconds.
+
+    Loops running concurrently (e.g. the capture, detection and action tasks of a
+    bot_pipeline.BotPipeline) keep separate iterations: stages timed inside
+    `with timer.loop('action'):` belong to the 'action' loop, whose iterations are closed by
+    end_iteration('action'), and a stage's share is of an iteration of its own loop. The loop
+    is tracked per asyncio task (a context variable), so tasks can't mix up their stages.
+
+    Template matching reports per-template costs through record_template(), which is
+    thread-safe so it can be called from matcher worker threads.
+    """
+
+    def __init__(self, window=200, report_interval=30.0, jsonl_path=None):
+        self.window = window
+        self.report_interval = report_interval
+        self.jsonl_path = jsonl_path
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.template_seconds = Counter()
+        self.template_calls = Counter()
+        self._template_lock = threading.Lock()
+        self._loop = contextvars.ContextVar('stage_timer_loop', default=MAIN_LOOP)
+        # Loop each stage was recorded in, and the running iteration of every loop
+        self.stage_loops = {}
+        self._current = defaultdict(dict)
+        self._iteration_start = {MAIN_LOOP: time.perf_counter()}
+        self._last_report = time.perf_counter()
+        self.iterations = 0
+        self.loop_iterations = Counter()
+
+    @staticmethod
+    def iteration_stage(loop):
+        """Name of the stage holding the iteration times of `loop`."""
+        return 'iteration' if loop == MAIN_LOOP else f'{loop}_iteration'
+
+    @contextmanager
+    def loop(self, name):
+        """Attributes the stages timed inside the block (in the current task) to loop `name`."""
+        self._iteration_start.setdefault(name, time.perf_counter())
+        token = self._loop.set(name)
+        try:
+            yield
+        finally:
+            self._loop.reset(token)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds, loop=None):
+        loop = loop or self._loop.get()
+        self.stage_loops[name] = loop
+        self.samples[name].append(seconds)
+        current = self._current[loop]
+        current[name] = current.get(name, 0.0) + seconds
+
+    def record_template(self, filename, seconds):
+        with self._template_lock:
+            self.template_seconds[filename] += seconds
+            self.template_calls[filename] += 1
+
+    def end_iteration(self, loop=MAIN_LOOP):
+        """Marks the end of one iteration of `loop`; writes/prints reports when due."""
+        now = time.perf_counter()
+        self.record(self.iteration_stage(loop), now - self._iteration_start.get(loop, now), loop)
+        self.loop_iterations[loop] += 1
+        if loop == MAIN_LOOP:
+            self.iterations += 1
+        if self.jsonl_path:
+            line = {'time': time.time(), 'loop': loop, 'iteration': self.loop_iterations[loop],
+                    'stages_ms': {name: seconds * 1000 for name, seconds in self._current.pop(loop, {}).items()}}
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(line) + '\n')
+        else:
+            self._current.pop(loop, None)
+        # Only the main loop prints, so concurrent loops don't print the summary several times
+        if loop == MAIN_LOOP and self.report_interval and now - self._last_report >= self.report_interval:
+            self.print_summary()
+            self._last_report = now
+        self._iteration_start[loop] = time.perf_counter()
+
+    def summary(self):
+        """
+        Per-stage statistics over the rolling window, plus the loop each stage belongs to and
+        its share of an iteration of that loop.
+        """
+        stages = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            loop = self.stage_loops.get(name, MAIN_LOOP)
+            # .get(), as indexing the defaultdict would add an empty iteration stage
+            iterations = self.samples.get(self.iteration_stage(loop))
+            iteration_mean = float(np.mean(iterations)) if iterations else 0.0
+            values = np.array(samples) * 1000
+            counts, _ = np.histogram(values, bins=(0, *HISTOGRAM_EDGES_MS, np.inf))
+            stages[name] = {
+                'loop': loop,
+                'count': len(values),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'max_ms': float(values.max()),
+                'share': float(values.mean() / 1000 / iteration_mean) if iteration_mean else 0.0,
+                'histogram': counts.tolist(),
+            }
+        return stages
+
+    def top_templates(self, count=10):
+        """Returns (filename, total seconds, calls) for the most expensive templates so far."""
+        with self._template_lock:
+            return [(filename, seconds, self.template_calls[filename])
+                    for filename, seconds in self.template_seconds.most_common(count)]
+
+    def print_summary(self, template_count=5):
+        stages = self.summary()
+        print(f"--- Timing over the last {len(self.samples.get('iteration', ()))} iterations ---")
+        for name, stats in sorted(stages.items(), key=lambda item: -item[1]['mean_ms']):
+            loop = "" if stats['loop'] == MAIN_LOOP else f"{stats['loop']} "
+            print(f"{name:>16}: mean {stats['mean_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+                  f"max {stats['max_ms']:8.1f} ms  ({stats['share']:.0%} of {loop}iteration)")
+        top = self.top_templates(template_count)
+        if top:
+            print("Most expensive templates:")
+            for filename, seconds, calls in top:
+                print(f"  {filename}: {seconds * 1000:.0f} ms total over {calls} matches")
@@ -1,307 +1,354 @@
 import asyncio
-from playwright.async_api import async_playwright
+import argparse
+import functools
 import os
-import re
-import aiohttp
 import cv2
 import numpy as np
-from PIL import Image
-import io
+from template_bank import MAX_FRAMES_PER_ENEMY, TemplateBank, get_template_bank
+from canvas_capture import CaptureService
+from incremental_detection import IncrementalDetector
+from template_index import TemplateIndex, default_history_path
+from tracking import EnemyTracker
+from canvas_scale import (CANVAS_GEOMETRY_JS, SCALE_TOLERANCE, estimate_scale, frame_to_page, is_native,
+                          resample_to_native, scale_detections, search_scale)
+from instrumentation import StageTimer
+from sprite_scraper import scrape_enemy_sprites
+from bot_pipeline import BotPipeline
+from template_matching import MATCH_MODES, match_templates_async
+from region_proposals import match_proposals
 
-async def capture_margonem_page(url: str, output_filename: str = "margonem_live_screenshot.png"):
-    """Launches a browser, navigates to the Margonem URL, and takes a screenshot."""
-    async with async_playwright() as p:
-        # Launch the browser (headless=False to see the browser, True for background)
-        # You can also specify browser_type: p.chromium, p.firefox, or p.webkit
-        browser = await p.chromium.launch(headless=False) 
-        page = await browser.new_page()
+# Name of the current map, from the game engine (new interface first, then the old one)
+CURRENT_LOCATION_JS = """() => {
+    if (window.Engine && Engine.map && Engine.map.d && Engine.map.d.name) return Engine.map.d.name;
+    if (window.map && window.map.name) return window.map.name;
+    return null;
+}"""
+
+# Everything the bot reads from the page per frame, in one round trip
+FRAME_STATE_JS = f"""(selector) => ({{
+    location: ({CURRENT_LOCATION_JS})(),
+    geometry: ({CANVAS_GEOMETRY_JS})(selector),
+}})"""
+
+async def capture_margonem_page(url: str, output_filename: str = "margonem_live_screenshot.png", capture=None):
+    """
+    Navigates to the Margonem URL and takes a screenshot. Pass a running CaptureService as
+    `capture` to reuse its browser; otherwise one is launched for this call and closed again.
+    """
+    owns_capture = capture is None
+    capture = capture or CaptureService(headless=False)
+    try:
+        await capture.open(url)
+        print("Page loaded successfully.")
         
-        print(f"Navigating to {url}...")
-        try:
-            # Go to the specified URL
-            # waitUntil can be 'load', 'domcontentloaded', 'networkidle'
-            await page.goto(url, wait_until="networkidle", timeout=60000) # Wait up to 60s for network to be idle
-            print("Page loaded successfully.")
-            
-            # Take a screenshot
-            print(f"Taking screenshot and saving as {output_filename}...")
-            await page.screenshot(path=output_filename)
-            print(f"Screenshot saved to {output_filename}")
-            
-        except Exception as e:
-            print(f"An error occurred during navigation or screenshot: {e}")
-        finally:
-            # Close the browser
-            await browser.close()
+        # Take a screenshot
+        print(f"Taking screenshot and saving as {output_filename}...")
+        await capture.screenshot(output_filename)
+        print(f"Screenshot saved to {output_filename}")
+        
+    except Exception as e:
+        print(f"An error occurred during navigation or screenshot: {e}")
+    finally:
+        if owns_capture:
+            await capture.stop()
             print("Browser closed.")
 
 async def scrape_enemy_sprites_from_html(html_table_body_content: str, output_base_dir: str = "templates"):
     """
     Parses HTML to find enemy sprites, extracts details, downloads, and saves them.
+    Downloads run concurrently and unchanged sprites are skipped (see sprite_scraper.py).
     """
-    enemies_dir = os.path.join(output_base_dir, "enemies")
-    os.makedirs(enemies_dir, exist_ok=True)
-    print(f"Saving enemy sprites to: {os.path.abspath(enemies_dir)}")
-
-    # Wrap the tbody content in a basic HTML structure for Playwright
-    full_html = f"<html><body><table>{html_table_body_content}</table></body></html>"
-
-    async with async_playwright() as p_manager:
-        browser = await p_manager.chromium.launch()
-        page = await browser.new_page()
-        await page.set_content(full_html)
-
-        image_elements = await page.query_selector_all('img.npc')
-        print(f"Found {len(image_elements)} enemy images to process.")
-
-        async with aiohttp.ClientSession() as session:
-            for i, element in enumerate(image_elements):
-                src_url = await element.get_attribute('src')
-                data_tip = await element.get_attribute('data-tip')
-
-                if not src_url or not data_tip:
-                    print(f"Skipping element {i+1} due to missing src or data-tip.")
-                    continue
-
-                # Parse name and level from data_tip
-                name_match = re.search(r"<b>(.*?)</b>", data_tip)
-                name = name_match.group(1) if name_match else f"unknown_enemy_{i+1}"
-                
-                level_match = re.search(r"</b>(\d+lvl)", data_tip)
-                level = level_match.group(1) if level_match else "lvlUnk"
-
-                # Sanitize name for filename
-                sanitized_name = re.sub(r'[\\/*?:"<>|]', "", name)
-                sanitized_name = sanitized_name.replace(" ", "_")
-                
-                # Get image extension
-                try:
-                    extension = src_url.split('.')[-1].split('?')[0]
-                    if not extension or len(extension) > 4 : # Basic check for valid extension
-                        filename_from_src = src_url.split('/')[-1].split('?')[0]
-                        extension = filename_from_src.split('.')[-1] if '.' in filename_from_src else 'png' # Default to png
-                except IndexError:
-                    extension = 'png' # Default if parsing fails
-
-                filename = f"{sanitized_name}_{level}.{extension}"
-                full_output_path = os.path.join(enemies_dir, filename)
-
-                try:
-                    print(f"Downloading {src_url} as {filename}...")
-                    async with session.get(src_url) as resp:
-                        if resp.status == 200:
-                            image_data = await resp.read()
-                            with open(full_output_path, 'wb') as f:
-                                f.write(image_data)
-                            print(f"Successfully saved {filename}")
-                        else:
-                            print(f"Failed to download {src_url}. Status: {resp.status}")
-                except Exception as e:
-                    print(f"Error downloading or saving {src_url}: {e}")
-            
-        await browser.close()
-    print("Finished scraping enemy sprites.")
+    return await scrape_enemy_sprites(html_table_body_content, output_base_dir)
 
-async def capture_canvas_screenshot(url: str, output_filename: str = "canvas.png"):
+async def capture_canvas_screenshot(url: str, output_filename: str = "canvas.png", capture=None):
     """
-    Launches a browser, navigates to the Margonem URL, and takes a screenshot of the canvas element.
+    Navigates to the Margonem URL and saves the canvas to an image. Pass a running
+    CaptureService as `capture` to reuse its browser; otherwise one is launched for this call.
     """
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        page = await browser.new_page()
-        print(f"Navigating to {url}...")
-        try:
-            await page.goto(url, wait_until="networkidle", timeout=60000)
-            print("Page loaded successfully.")
-            # Wait for the canvas to appear
-            await page.wait_for_selector('canvas', timeout=30000)
-            canvas = await page.query_selector('canvas')
-            if canvas:
-                print("Canvas found. Taking screenshot...")
-                await canvas.screenshot(path=output_filename)
-                print(f"Canvas screenshot saved to {output_filename}")
-            else:
-                print("Canvas element not found!")
-        except Exception as e:
-            print(f"An error occurred: {e}")
-        finally:
-            await browser.close()
+    owns_capture = capture is None
+    capture = capture or CaptureService(headless=False)
+    try:
+        await capture.open(url)
+        print("Page loaded successfully.")
+        # Wait for the canvas to appear
+        await capture.wait_for_canvas()
+        if await capture.save_canvas(output_filename):
+            print(f"Canvas screenshot saved to {output_filename}")
+        else:
+            print("Canvas element not found!")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if owns_capture:
+            await capture.stop()
             print("Browser closed.")
 
-async def find_enemies_on_canvas(canvas_screenshot_path, template_dir, threshold=0.7):
+async def find_enemies_on_canvas(canvas_image, templates, threshold=0.7, mode='exhaustive', workers=1, cache=None,
+                                 proposal_index=None, scale=1.0, **match_options):
     """
-    Find enemy sprites on the canvas screenshot using template matching.
+    Find enemy sprites on the canvas using template matching.
+    `canvas_image` is a BGR or grayscale NumPy array (e.g. from CanvasFrameGrabber) or a path to a screenshot.
+    `templates` is either a TemplateBank or a template directory (loaded once and reused).
+    `mode` selects the matcher ('exhaustive' or 'pyramid', see template_matching.match_templates).
+    Matching runs off the event loop, sharded across `workers` threads.
+    With a DetectionCache as `cache`, a frame identical to a recently analysed one reuses its results.
+    With a ColorSignatureIndex as `proposal_index` (colour frames only), templates are only matched
+    in the candidate regions whose colours fit them (see region_proposals.py).
+    `scale` is how many frame pixels a sprite pixel covers (see canvas_scale.estimate_scale); other
+    scales than 1 are matched on the frame resampled once to native size. With scale=None a few
+    scales are tried (canvas_scale.search_scale), which costs a full scan each.
     Returns a list of tuples (enemy_name, match_position, match_confidence).
     """
-    print(f"Looking for enemies in {canvas_screenshot_path}...")
-    
-    # Read the canvas screenshot
-    canvas_img = cv2.imread(canvas_screenshot_path)
-    if canvas_img is None:
-        print(f"Error: Could not read canvas screenshot at {canvas_screenshot_path}")
-        return []
+    if isinstance(canvas_image, np.ndarray):
+        canvas_img = canvas_image
+    else:
+        print(f"Looking for enemies in {canvas_image}...")
+        
+        # Read the canvas screenshot
+        canvas_img = cv2.imread(canvas_image)
+        if canvas_img is None:
+            print(f"Error: Could not read canvas screenshot at {canvas_image}")
+            return []
     
     # Convert to grayscale for better matching
-    canvas_gray = cv2.cvtColor(canvas_img, cv2.COLOR_BGR2GRAY)
+    if canvas_img.ndim == 3:
+        canvas_gray = cv2.cvtColor(canvas_img, cv2.COLOR_BGR2GRAY)
+    else:
+        canvas_gray = canvas_img
     
-    results = []
+    bank = templates if isinstance(templates, TemplateBank) else get_template_bank(templates)
     
-    # Loop through all enemy templates
-    for filename in os.listdir(template_dir):
-        if not (filename.endswith('.png') or filename.endswith('.gif') or filename.endswith('.jpg')):
-            continue
-            
-        template_path = os.path.join(template_dir, filename)
-        
-        # For GIF files, we need to extract the first frame
-        if filename.endswith('.gif'):
-            try:
-                with Image.open(template_path) as img:
-                    # Convert PIL Image to cv2 format
-                    img_array = np.array(img.convert('RGB'))
-                    template_img = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            except Exception as e:
-                print(f"Error processing GIF {filename}: {e}")
-                continue
-        else:
-            # For PNG/JPG, read directly
-            template_img = cv2.imread(template_path)
-            
-        if template_img is None:
-            print(f"Could not read template {filename}")
-            continue
-            
-        # Convert template to grayscale
-        template_gray = cv2.cvtColor(template_img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply template matching
-        res = cv2.matchTemplate(canvas_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-        
-        # Get positions where match exceeds threshold
-        loc = np.where(res >= threshold)
-        
-        for pt in zip(*loc[::-1]):  # Switch columns and rows
-            # Get the match confidence at this point
-            confidence = res[pt[1], pt[0]]
-            
-            # Get enemy name from filename (remove level and extension)
-            enemy_name = os.path.splitext(filename)[0]
-            enemy_name = enemy_name.split('_lvl')[0]
-            
-            results.append({
-                'name': enemy_name,
-                'position': pt,  # (x, y) coordinates
-                'confidence': float(confidence),
-                'width': template_gray.shape[1],
-                'height': template_gray.shape[0]
-            })
+    if scale is None:
+        loop = asyncio.get_running_loop()
+        scale, results = await loop.run_in_executor(None, functools.partial(
+            search_scale, canvas_gray, bank, threshold, mode, workers=workers, **match_options))
+        print(f"Found {len(results)} potential enemy matches (estimated scale {scale})")
+        return results
+    if not is_native(scale):
+        # Match at the sprites' native size and map the results back to the frame
+        native_results = await find_enemies_on_canvas(resample_to_native(canvas_img, scale), bank, threshold, mode,
+                                                      workers, cache, proposal_index, **match_options)
+        return scale_detections(native_results, scale)
+    
+    # Colour proposals need a colour frame
+    use_proposals = proposal_index is not None and canvas_img.ndim == 3
+    
+    if cache is not None:
+        cache_key = cache.key(canvas_gray, bank, threshold, mode,
+                              proposal_index=proposal_index if use_proposals else None, **match_options)
+        results = cache.get(cache_key)
+        if results is not None:
+            print(f"Found {len(results)} potential enemy matches (unchanged frame, cached)")
+            return results
     
-    # Sort by confidence (highest first)
-    results.sort(key=lambda x: x['confidence'], reverse=True)
+    if use_proposals:
+        # Only the (region, templates) pairs whose colours fit are matched
+        loop = asyncio.get_running_loop()
+        proposals = await loop.run_in_executor(None, functools.partial(
+            proposal_index.propose, canvas_img, match_options.pop('template_indices', None)))
+        results = await loop.run_in_executor(None, functools.partial(
+            match_proposals, canvas_gray, bank, proposals, threshold, mode, workers=workers, **match_options))
+    else:
+        # Match all preloaded enemy templates (sorted by confidence, highest first)
+        results = await match_templates_async(canvas_gray, bank, threshold, mode=mode, workers=workers, **match_options)
     print(f"Found {len(results)} potential enemy matches")
+    if cache is not None:
+        cache.put(cache_key, results)
     
     return results
 
-async def find_and_fight_enemies(url: str):
+def find_closest_enemy(enemies, center_x, center_y):
+    """Returns the enemy whose center is nearest to (center_x, center_y), or None if there are none."""
+    if not enemies:
+        return None
+    boxes = np.array([(e['position'][0], e['position'][1], e['width'], e['height']) for e in enemies], dtype=np.float64)
+    enemy_centers = boxes[:, :2] + boxes[:, 2:] / 2
+    distances = np.hypot(enemy_centers[:, 0] - center_x, enemy_centers[:, 1] - center_y)
+    return enemies[int(np.argmin(distances))]
+
+async def find_and_fight_enemies(url: str, debug: bool = False, match_mode: str = 'pyramid', workers: int = 1,
+                                 max_frames_per_enemy: int = MAX_FRAMES_PER_ENEMY, min_level: int = None,
+                                 max_level: int = None, catalog_scan_interval: int = 20, timing_log: str = None,
+                                 timing_interval: float = 30.0, fps: float = 10.0, duration: float = None,
+                                 full_detection_interval: int = 10):
     """
     Main bot function that captures the canvas, finds enemies, and clicks on them.
+    Frames are kept in memory; with debug=True each frame is also saved to current_canvas.png.
+    
+    Capture (at up to `fps`), detection and clicking/fighting run concurrently (see
+    bot_pipeline.BotPipeline), each stage working on the most recent output of the previous
+    one. The bot runs until Ctrl+C or, if given, for `duration` seconds.
+    
+    Only templates within [min_level, max_level] are matched. Once enemies have been seen on the
+    current map, only those are matched there; every `catalog_scan_interval` detections the whole
+    (level-filtered) catalog is matched again so newly appearing enemies are learned.
+    
+    Enemies are tracked between frames (see tracking.EnemyTracker): known enemies are only
+    re-verified near their last position, and detection runs every `full_detection_interval`
+    frames or when an enemy is lost. The bot keeps clicking the same tracked enemy until it
+    disappears rather than switching to whichever one is closest in each frame.
+    
+    Every stage is timed; a summary (including the most expensive templates) is printed every
+    `timing_interval` seconds and, with `timing_log`, each detection (and each capture and
+    action, as their own loops) is appended to that file as a JSON line.
     """
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        page = await browser.new_page()
-        
-        print(f"Navigating to {url}...")
-        await page.goto(url, wait_until="networkidle", timeout=60000)
+    timer = StageTimer(report_interval=timing_interval, jsonl_path=timing_log)
+    # One browser for the whole run; frames are read from its canvas
+    async with CaptureService(headless=False, timer=timer) as capture:
+        await capture.goto(url)
+        page = capture.page
         print("Page loaded. Waiting for login...")
         
+        # Decode all enemy templates once, before the loop starts
+        enemies_dir = os.path.join("templates", "enemies")
+        template_bank = TemplateBank.load(enemies_dir, max_frames_per_enemy=max_frames_per_enemy)
+        # Only re-matches the parts of the canvas that changed since the previous frame
+        detector = IncrementalDetector(template_bank, mode=match_mode, workers=workers, profiler=timer)
+        # Between detections, known enemies are only re-verified around their last position
+        tracker = EnemyTracker(template_bank, detect=detector.detect, full_detection_interval=full_detection_interval)
+        target_track_id = None
+        # Frame pixels per sprite pixel; frames are resampled to native size before detection
+        frame_scale = None
+        # Remembers which enemies appear on which map, across runs
+        template_index = TemplateIndex(template_bank, default_history_path(enemies_dir))
+        detection_count = 0
+        
         # Wait for user to manually log in (we can automate this later)
         input("Please log in manually and press Enter when ready...")
+        print("Bot running, press Ctrl+C to stop.")
+        
+        async def capture_frames():
+            # Copies, as a frame is still being detected while the next one is captured
+            async for frame in capture.frames(fps, copy=True):
+                if debug:
+                    with timer.stage('debug_write'):
+                        cv2.imwrite("current_canvas.png", frame)
+                with timer.stage('location'):
+                    state = await page.evaluate(FRAME_STATE_JS, capture.grabber.selector)
+                yield {'frame': frame, **state}
+        
+        async def detect(captured):
+            nonlocal detection_count, frame_scale
+            frame = captured['frame']
+            scale = estimate_scale(frame.shape, captured['geometry'])
+            if scale is None and frame_scale is None:
+                # No canvas geometry: try a few scales once and keep the best one
+                with timer.stage('scale_search'):
+                    scale, _ = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                        search_scale, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), template_bank, mode=match_mode,
+                        workers=workers))
+                scale = scale or 1.0
+            scale = scale or frame_scale
+            if frame_scale is None or abs(scale - frame_scale) > SCALE_TOLERANCE:
+                if frame_scale is not None:
+                    print(f"Canvas scale changed from {frame_scale:.2f} to {scale:.2f}, detecting again")
+                frame_scale = scale
+                detector.reset()
+                tracker.reset()
+            
+            # Only match the enemies plausible on this map (the full catalog every
+            # `catalog_scan_interval` detections); frames that only verify tracks don't count
+            location = captured['location']
+            full_catalog = False
+            if tracker.next_update_full:
+                full_catalog = detection_count % catalog_scan_interval == 0
+                detection_count += 1
+                detector.set_template_indices(template_index.query(
+                    min_level, max_level, location=None if full_catalog else location))
+            
+            # Find enemies on the canvas
+            with timer.stage('detect'):
+                enemies = await tracker.update_async(resample_to_native(frame, frame_scale))
+            enemies = scale_detections(enemies, frame_scale)
+            if not tracker.last_update['full']:
+                print(f"Tracking {len(enemies)} enemies")
+                return enemies
+            if location:
+                template_index.record_detections(location, enemies)
+                if full_catalog:
+                    template_index.save()
+            scan = detector.last_scan
+            if scan['full']:
+                print(f"Found {len(enemies)} enemies (full scan)")
+            else:
+                print(f"Found {len(enemies)} enemies (rescanned {scan['searched_fraction']:.0%} of the canvas)")
+            return enemies
         
-        while True:
+        async def fight_closest(captured, enemies):
+            nonlocal target_track_id
+            if not enemies:
+                return False
+            
+            # The frame has the canvas dimensions; enemies are searched from its center
+            canvas_height, canvas_width = captured['frame'].shape[:2]
+            center_x = canvas_width / 2
+            center_y = canvas_height / 2
+            
+            # Stay on the enemy targeted before while it is tracked, else take the closest to the center
+            with timer.stage('select'):
+                closest_enemy = next((e for e in enemies if e['track_id'] == target_track_id), None)
+                if closest_enemy is None:
+                    closest_enemy = find_closest_enemy(enemies, center_x, center_y)
+                target_track_id = closest_enemy['track_id']
+            
+            print(f"Found closest enemy: {closest_enemy['name']} at position {closest_enemy['position']}")
+            
+            # Calculate click position (center of the enemy)
+            click_x, click_y = frame_to_page(closest_enemy['position'][0] + closest_enemy['width'] / 2,
+                                             closest_enemy['position'][1] + closest_enemy['height'] / 2,
+                                             captured['frame'].shape, captured['geometry'])
+            
+            # Click on the enemy
+            with timer.stage('click'):
+                await page.mouse.click(click_x, click_y)
+            print(f"Clicked at position ({click_x}, {click_y})")
+            
+            # Look for and click the "Fight" button
+            # This part depends on the game's UI, we may need to adjust selectors
             try:
-                # Ensure we have the canvas
-                canvas = await page.query_selector('canvas')
-                if not canvas:
-                    print("Canvas not found! Waiting...")
-                    await asyncio.sleep(2)
-                    continue
-                
-                # Take a screenshot of the canvas
-                await canvas.screenshot(path="current_canvas.png")
-                
-                # Find enemies on the canvas
-                enemies_dir = os.path.join("templates", "enemies")
-                enemies = await find_enemies_on_canvas("current_canvas.png", enemies_dir)
-                
-                if not enemies:
-                    print("No enemies found. Waiting...")
-                    await asyncio.sleep(2)
-                    continue
-                
-                # Get canvas dimensions for center calculation
-                canvas_size = await page.evaluate("""() => {
-                    const canvas = document.querySelector('canvas');
-                    return { width: canvas.width, height: canvas.height };
-                }""")
-                
-                center_x = canvas_size['width'] / 2
-                center_y = canvas_size['height'] / 2
-                
-                # Find the closest enemy to the center of the screen
-                closest_enemy = None
-                closest_distance = float('inf')
-                
-                for enemy in enemies:
-                    # Calculate center point of the enemy
-                    enemy_center_x = enemy['position'][0] + enemy['width'] / 2
-                    enemy_center_y = enemy['position'][1] + enemy['height'] / 2
-                    
-                    # Calculate distance from center
-                    distance = ((enemy_center_x - center_x) ** 2 + (enemy_center_y - center_y) ** 2) ** 0.5
+                with timer.stage('fight_button'):
+                    fight_button = await page.wait_for_selector('button:has-text("Fight")', timeout=3000)
+                if fight_button:
+                    await fight_button.click()
+                    print("Clicked Fight button")
                     
-                    if distance < closest_distance:
-                        closest_distance = distance
-                        closest_enemy = enemy
-                
-                if closest_enemy:
-                    print(f"Found closest enemy: {closest_enemy['name']} at position {closest_enemy['position']}")
-                    
-                    # Calculate click position (center of the enemy)
-                    click_x = closest_enemy['position'][0] + closest_enemy['width'] / 2
-                    click_y = closest_enemy['position'][1] + closest_enemy['height'] / 2
-                    
-                    # Click on the enemy
-                    await page.mouse.click(click_x, click_y)
-                    print(f"Clicked at position ({click_x}, {click_y})")
-                    
-                    # Look for and click the "Fight" button
-                    # This part depends on the game's UI, we may need to adjust selectors
-                    try:
-                        fight_button = await page.wait_for_selector('button:has-text("Fight")', timeout=3000)
-                        if fight_button:
-                            await fight_button.click()
-                            print("Clicked Fight button")
-                            
-                            # Wait for fight to complete
-                            await asyncio.sleep(5)  # Adjust based on typical fight duration
-                    except Exception as e:
-                        print(f"Could not find or click Fight button: {e}")
-                
-                # Wait a bit before next iteration
-                await asyncio.sleep(1)
-                
+                    # Wait for fight to complete
+                    with timer.stage('fight_wait'):
+                        await asyncio.sleep(5)  # Adjust based on typical fight duration
             except Exception as e:
-                print(f"An error occurred: {e}")
-                await asyncio.sleep(5)
+                print(f"Could not find or click Fight button: {e}")
             
-            # Optional: Add a way to exit the loop
-            if input("Press Enter to continue, 'q' to quit: ").lower() == 'q':
-                break
-                
-        await browser.close()
-        print("Browser closed.")
+            # Wait a bit before acting again
+            with timer.stage('sleep'):
+                await asyncio.sleep(1)
+            return True
+        
+        # Passed uncalled, so the pipeline can restart capture after an error
+        pipeline = BotPipeline(capture_frames, detect, fight_closest, timer=timer, report_interval=timing_interval)
+        await pipeline.run(duration)
+        
+        template_index.save()
+        pipeline.print_metrics()
+        timer.print_summary()
+    print("Browser closed.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Margonem bot")
+    parser.add_argument("--debug", action="store_true", help="Save every captured frame to current_canvas.png")
+    parser.add_argument("--match-mode", choices=MATCH_MODES, default="pyramid", help="Template matching engine")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Threads used for template matching")
+    parser.add_argument("--max-frames-per-enemy", type=int, default=MAX_FRAMES_PER_ENEMY,
+                        help="Distinct animation frames matched per enemy (1 = first frame only)")
+    parser.add_argument("--min-level", type=int, help="Ignore enemies below this level")
+    parser.add_argument("--max-level", type=int, help="Ignore enemies above this level")
+    parser.add_argument("--timing-log", help="Append per-iteration stage timings to this JSON lines file")
+    parser.add_argument("--timing-interval", type=float, default=30.0, help="Seconds between timing summaries")
+    parser.add_argument("--fps", type=float, default=10.0, help="Maximum canvas captures per second")
+    parser.add_argument("--duration", type=float, help="Stop the bot after this many seconds")
+    parser.add_argument("--full-detection-interval", type=int, default=10,
+                        help="Frames between full detections; in between, known enemies are only re-verified")
+    args = parser.parse_args()
+    
     margonem_url = "https://gordion.margonem.pl/"
     # Choose which function to run
     print("Choose an operation:")
@@ -313,6 +360,11 @@ if __name__ == "__main__":
     if choice == "1":
         asyncio.run(capture_canvas_screenshot(margonem_url, output_filename="canvas.png"))
     elif choice == "2":
-        asyncio.run(find_and_fight_enemies(margonem_url))
+        asyncio.run(find_and_fight_enemies(margonem_url, debug=args.debug, match_mode=args.match_mode, workers=args.workers,
+                                           max_frames_per_enemy=args.max_frames_per_enemy,
+                                           min_level=args.min_level, max_level=args.max_level,
+                                           timing_log=args.timing_log, timing_interval=args.timing_interval,
+                                           fps=args.fps, duration=args.duration,
+                                           full_detection_interval=args.full_detection_interval))
     else:
         print("Invalid choice!")
\ No newline at end of file
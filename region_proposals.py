@@ -0,0 +1,215 @@
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from incremental_detection import merge_rects
+from template_bank import TemplateBank, decode_template_frames
+from template_matching import MATCH_MODES, match_templates, suppress_overlapping_results
+
+# Colour quantization of the signatures: hue x saturation x value bins
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 16, 4, 4
+COLOR_BINS = HUE_BINS * SATURATION_BINS * VALUE_BINS
+
+
+def color_bins(image_bgr):
+    """Returns the colour bin (0..COLOR_BINS-1) of every pixel of a BGR image."""
+    hsv = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2HSV)
+    hue = hsv[:, :, 0].astype(np.int32) * HUE_BINS // 180
+    saturation = hsv[:, :, 1].astype(np.int32) * SATURATION_BINS // 256
+    value = hsv[:, :, 2].astype(np.int32) * VALUE_BINS // 256
+    return (hue * SATURATION_BINS + saturation) * VALUE_BINS + value
+
+
+def _grow(rect, dx, dy, shape):
+    x, y, w, h = rect
+    x0, y0 = max(x - dx, 0), max(y - dy, 0)
+    x1, y1 = min(x + w + dx, shape[1]), min(y + h + dy, shape[0])
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+class ColorSignatureIndex:
+    """
+    Colour signatures (quantized HSV histograms of the opaque pixels) of every template in a
+    TemplateBank, used to propose where - and with which templates - matching is worth running.
+
+    propose() back-projects the ratio of the sprite colour model to the canvas' own colour
+    histogram, so colours common in sprites but rare on the current map light up. Every blob
+    becomes a candidate box, and only the templates whose colours are (mostly) present around
+    the box are kept for it. match_proposals() then runs matchTemplate on just those
+    (region, templates) pairs.
+
+    Args:
+        ratio_threshold: How many times more frequent a colour must be in sprites than on the
+            canvas to fully count as sprite colour
+        density_threshold: Share of sprite-coloured pixels around a pixel (in a window of
+            `density_window` pixels) needed for it to belong to a blob
+        min_fit: Fraction of a template's colour mass that must be found around a blob
+        min_blob_area: Smaller blobs are ignored as noise
+    """
+
+    def __init__(self, bank, signatures, ratio_threshold=4.0, density_threshold=0.5, density_window=15, min_fit=0.7,
+                 min_blob_area=12):
+        self.bank = bank
+        self.signatures = np.asarray(signatures, dtype=np.float32)
+        self.ratio_threshold = ratio_threshold
+        self.density_threshold = density_threshold
+        self.density_window = density_window
+        self.min_fit = min_fit
+        self.min_blob_area = min_blob_area
+        sizes = self.signatures.sum(axis=1, keepdims=True)
+        self._normalized = self.signatures / np.maximum(sizes, 1)
+
+    @classmethod
+    def build(cls, bank, template_dir=None, **options):
+        """Computes the signature of every bank entry from the colour frames in template_dir."""
+        template_dir = template_dir or bank.template_dir
+        signatures = np.zeros((len(bank), COLOR_BINS), dtype=np.float32)
+        frames_by_file = {}
+        for i, filename in enumerate(bank.filenames):
+            if filename not in frames_by_file:
+                frames_by_file[filename] = decode_template_frames(os.path.join(template_dir, filename))
+            frames = frames_by_file[filename]
+            if not frames:
+                continue
+            frame_index = min(int(bank.frame_indices[i]), len(frames) - 1)
+            _, alpha, bgr = frames[frame_index]
+            signatures[i] = np.bincount(color_bins(bgr)[alpha > 0], minlength=COLOR_BINS)
+        return cls(bank, signatures, **options)
+
+    def propose(self, canvas_bgr, template_indices=None):
+        """
+        Returns candidate dicts with 'box' (the sprite-coloured blob), 'region' (the box grown
+        so any kept template overlapping it fits inside) and 'template_indices' (templates whose
+        signatures fit the region), all as (x, y, w, h) / bank indices.
+        """
+        indices = np.arange(len(self.bank)) if template_indices is None else np.asarray(template_indices)
+        if len(indices) == 0:
+            return []
+        bins = color_bins(canvas_bgr)
+        canvas_histogram = np.bincount(bins.ravel(), minlength=COLOR_BINS) / bins.size
+        sprite_model = self._normalized[indices].mean(axis=0)
+        ratio = sprite_model / np.maximum(canvas_histogram, 1e-9)
+        sprite_color = np.minimum(ratio / self.ratio_threshold, 1.0).astype(np.float32)
+
+        # Sprites are dense clusters of sprite colours; isolated pixels of them are background
+        density = cv2.blur(sprite_color[bins], (self.density_window, self.density_window))
+        blob_mask = (density >= self.density_threshold).astype(np.uint8)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(blob_mask, connectivity=8)
+        blobs = merge_rects([tuple(int(v) for v in stats[k, :4]) for k in range(1, count)
+                             if stats[k, 4] >= self.min_blob_area])
+
+        signatures = self.signatures[indices]
+        signature_sizes = np.maximum(signatures.sum(axis=1), 1)
+        typical_h, typical_w = (int(v) for v in np.median(self.bank.shapes[indices], axis=0))
+
+        proposals = []
+        for box in blobs:
+            # The blob may be any part of a sprite: take the colours of its surroundings too
+            x, y, w, h = _grow(box, typical_w // 2, typical_h // 2, bins.shape)
+            region_histogram = np.bincount(bins[y:y + h, x:x + w].ravel(), minlength=COLOR_BINS)
+            fit = np.minimum(signatures, region_histogram).sum(axis=1) / signature_sizes
+            kept = indices[fit >= self.min_fit]
+            if len(kept) == 0:
+                continue
+            max_h, max_w = self.bank.shapes[kept].max(axis=0)
+            proposals.append({
+                'box': box,
+                # Every placement of a kept template that overlaps the blob
+                'region': _grow(box, int(max_w), int(max_h), bins.shape),
+                'template_indices': kept.tolist(),
+            })
+        return proposals
+
+
+def match_proposals(canvas_gray, bank, proposals, threshold=0.7, mode='exhaustive', **match_options):
+    """Matches each proposal's templates inside its region only; returns match_templates-style results."""
+    nms_iou = match_options.get('nms_iou', 0.3)
+    results = []
+    for proposal in proposals:
+        results.extend(match_templates(canvas_gray, bank, threshold, mode, regions=[proposal['region']],
+                                       template_indices=proposal['template_indices'], **match_options))
+    return suppress_overlapping_results(results, nms_iou)
+
+
+def proposal_work_fraction(proposals, canvas_shape, template_count):
+    """Searched pixel x template work of the proposals relative to matching every template everywhere."""
+    full = canvas_shape[0] * canvas_shape[1] * template_count
+    work = sum(p['region'][2] * p['region'][3] * len(p['template_indices']) for p in proposals)
+    return work / full if full else 0.0
+
+
+def evaluate_proposals(index, frames, threshold=0.7, mode='exhaustive', **match_options):
+    """
+    Runs full matching and proposal-guided matching on (canvas_bgr, truth) frames (see
+    benchmark.synthesize_canvas) and reports recall of both, the recall lost by the proposal
+    stage, the mean fraction of pixel x template work it keeps and the time both took.
+    """
+    # The offline harness (tracemalloc, resource) is only needed here, not by the bot
+    from benchmark import score_detections
+
+    totals = {'full': [0, 0, 0.0], 'proposals': [0, 0, 0.0]}
+    work_fractions = []
+    for canvas_bgr, truth in frames:
+        canvas_gray = cv2.cvtColor(canvas_bgr, cv2.COLOR_BGR2GRAY)
+
+        start = time.perf_counter()
+        detections = match_templates(canvas_gray, index.bank, threshold, mode, **match_options)
+        totals['full'][2] += time.perf_counter() - start
+        true_positives, _, expected = score_detections(detections, truth)
+        totals['full'][0] += true_positives
+        totals['full'][1] += expected
+
+        start = time.perf_counter()
+        proposals = index.propose(canvas_bgr)
+        detections = match_proposals(canvas_gray, index.bank, proposals, threshold, mode, **match_options)
+        totals['proposals'][2] += time.perf_counter() - start
+        true_positives, _, expected = score_detections(detections, truth)
+        totals['proposals'][0] += true_positives
+        totals['proposals'][1] += expected
+        work_fractions.append(proposal_work_fraction(proposals, canvas_gray.shape, len(index.bank)))
+
+    full_recall = totals['full'][0] / totals['full'][1] if totals['full'][1] else 1.0
+    proposal_recall = totals['proposals'][0] / totals['proposals'][1] if totals['proposals'][1] else 1.0
+    return {
+        'frames': len(frames),
+        'full_recall': full_recall,
+        'proposal_recall': proposal_recall,
+        'recall_loss': full_recall - proposal_recall,
+        'work_fraction': float(np.mean(work_fractions)) if work_fractions else 0.0,
+        'full_seconds': totals['full'][2],
+        'proposal_seconds': totals['proposals'][2],
+    }
+
+
+if __name__ == "__main__":
+    from benchmark import load_backgrounds, load_sprites, synthesize_canvas
+
+    parser = argparse.ArgumentParser(description="Measure the colour proposal stage on synthetic canvases")
+    parser.add_argument("--templates", default="templates/enemies", help="Directory containing enemy templates")
+    parser.add_argument("--threshold", type=float, default=0.7, help="Matching threshold (0.0 to 1.0)")
+    parser.add_argument("--mode", choices=MATCH_MODES, default="exhaustive", help="Matching engine")
+    parser.add_argument("--frames", type=int, default=5, help="Number of synthetic canvases")
+    parser.add_argument("--sprites", type=int, default=8, help="Sprites composited per canvas")
+    parser.add_argument("--backgrounds", help="Directory of background images (e.g. empty map screenshots)")
+    parser.add_argument("--ratio-threshold", type=float, default=4.0, help="How much more frequent in sprites than on the canvas a colour must be")
+    parser.add_argument("--min-fit", type=float, default=0.7, help="Share of a template's colours required around a box")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, so runs are comparable")
+
+    args = parser.parse_args()
+
+    bank = TemplateBank.load(args.templates)
+    index = ColorSignatureIndex.build(bank, args.templates, ratio_threshold=args.ratio_threshold, min_fit=args.min_fit)
+
+    sprites = load_sprites(args.templates)
+    background_images = load_backgrounds(args.backgrounds)
+
+    rng = np.random.default_rng(args.seed)
+    frames = [synthesize_canvas(sprites, rng, sprite_count=args.sprites, background_images=background_images)
+              for _ in range(args.frames)]
+    report = evaluate_proposals(index, frames, args.threshold, args.mode)
+
+    print(f"Recall: {report['full_recall']:.3f} full, {report['proposal_recall']:.3f} with proposals "
+          f"(loss {report['recall_loss']:.3f})")
+    print(f"Pixel x template work kept: {report['work_fraction']:.1%}")
+    print(f"Time: {report['full_seconds']:.2f}s full, {report['proposal_seconds']:.2f}s with proposals")
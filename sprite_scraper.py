@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+from html.parser import HTMLParser
+import aiohttp
+
+# Statuses worth retrying; anything else (404, 403...) fails straight away
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def default_manifest_path(enemies_dir):
+    """Returns the file the download manifest of a template directory is kept in."""
+    return os.path.normpath(enemies_dir) + ".sprites.json"
+
+
+def sprite_filename(src_url, data_tip, fallback_name):
+    """
+    Builds the template filename '<Name>_<level>.<ext>' from an enemy image's src and data-tip
+    (e.g. '<b>Adept</b>19lvl' -> 'Adept_19lvl.gif'); the level is 'lvlUnk' when the tip has none.
+    """
+    name_match = re.search(r"<b>(.*?)</b>", data_tip)
+    name = name_match.group(1) if name_match else fallback_name
+
+    level_match = re.search(r"</b>(\d+lvl)", data_tip)
+    level = level_match.group(1) if level_match else "lvlUnk"
+
+    # Sanitize name for filename
+    sanitized_name = re.sub(r'[\\/*?:"<>|]', "", name)
+    sanitized_name = sanitized_name.replace(" ", "_")
+
+    # Get image extension
+    path = src_url.split('?')[0].split('/')[-1]
+    extension = path.rsplit('.', 1)[-1] if '.' in path else ''
+    if not extension or len(extension) > 4:  # Basic check for valid extension
+        extension = 'png'
+
+    return f"{sanitized_name}_{level}.{extension}"
+
+
+class _EnemyImageParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.images = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'img':
+            return
+        attrs = dict(attrs)
+        if 'npc' in (attrs.get('class') or '').split():
+            self.images.append((attrs.get('src'), attrs.get('data-tip')))
+
+
+def parse_enemy_sprites(html):
+    """
+    Finds the enemy images (img.npc) in an HTML page or table fragment, without a browser.
+    Returns dicts with 'url' and 'filename', in page order; images missing src or data-tip are skipped.
+    """
+    parser = _EnemyImageParser()
+    parser.feed(html)
+    parser.close()
+
+    sprites = []
+    for i, (src_url, data_tip) in enumerate(parser.images):
+        if not src_url or not data_tip:
+            print(f"Skipping element {i+1} due to missing src or data-tip.")
+            continue
+        sprites.append({'url': src_url, 'filename': sprite_filename(src_url, data_tip, f"unknown_enemy_{i+1}")})
+    return sprites
+
+
+class SpriteManifest:
+    """
+    Remembers, per sprite URL, the file it was saved as, its ETag / Last-Modified headers and the
+    SHA-256 of its contents. Re-runs send conditional requests for sprites whose file still
+    exists, so unchanged sprites cost a 304 instead of a download, and the hashes let identical
+    images served under different URLs be saved only once ('duplicate_of' names the kept file).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def file_for_hash(self, sha256):
+        """Returns the saved file holding an image with this hash, or None."""
+        for entry in self.entries.values():
+            if entry.get('sha256') == sha256 and not entry.get('duplicate_of'):
+                return entry['filename']
+        return None
+
+    def save(self, path=None):
+        path = path or self.path
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    def load(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable sprite manifest {path}: {e}")
+
+
+class SpriteDownloader:
+    """
+    Downloads enemy sprites over one pooled aiohttp session, at most `concurrency` at a time,
+    retrying connection errors and retryable statuses up to `retries` times with exponential
+    backoff (`backoff`, 2 * `backoff`, ...). Files are written atomically, so an interrupted run
+    never leaves half-written templates behind and can simply be restarted; a sprite that can't
+    be written counts as failed without stopping the others.
+    """
+
+    def __init__(self, enemies_dir, manifest, concurrency=8, retries=3, backoff=0.5, timeout=30.0):
+        self.enemies_dir = enemies_dir
+        self.manifest = manifest
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    async def download_all(self, sprites):
+        """Downloads every sprite dict from parse_enemy_sprites(); returns a Counter-like dict of outcomes."""
+        os.makedirs(self.enemies_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            outcomes = await asyncio.gather(*(self._download(session, semaphore, sprite) for sprite in sprites))
+        counts = {'downloaded': 0, 'unchanged': 0, 'duplicate': 0, 'failed': 0}
+        for outcome in outcomes:
+            counts[outcome] += 1
+        return counts
+
+    async def _download(self, session, semaphore, sprite):
+        url, filename = sprite['url'], sprite['filename']
+        entry = self.manifest.entries.get(url)
+        headers = {}
+        if entry and self._entry_file_exists(entry):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    async with session.get(url, headers=headers) as resp:
+                        if resp.status == 304:
+                            return 'unchanged'
+                        if resp.status == 200:
+                            image_data = await resp.read()
+                            return self._store(url, filename, image_data, resp.headers)
+                        if resp.status not in RETRY_STATUSES:
+                            print(f"Failed to download {url}. Status: {resp.status}")
+                            return 'failed'
+                        error = f"status {resp.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        print(f"Giving up on {url} after {self.retries + 1} attempts ({error})")
+        return 'failed'
+
+    def _entry_file_exists(self, entry):
+        return os.path.exists(os.path.join(self.enemies_dir, entry.get('duplicate_of') or entry['filename']))
+
+    def _store(self, url, filename, image_data, headers):
+        # No awaits below, so concurrent downloads can't both claim the same hash
+        sha256 = hashlib.sha256(image_data).hexdigest()
+        entry = {'filename': filename, 'sha256': sha256,
+                 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+        previous = self.manifest.entries.get(url)
+        existing = self.manifest.file_for_hash(sha256)
+
+        if existing is not None and existing != filename and os.path.exists(os.path.join(self.enemies_dir, existing)):
+            entry['duplicate_of'] = existing
+            self.manifest.entries[url] = entry
+            print(f"{url} is identical to {existing}, not saving {filename}")
+            return 'duplicate'
+
+        if previous and previous.get('sha256') == sha256 and self._entry_file_exists(previous):
+            self.manifest.entries[url] = entry
+            return 'unchanged'
+
+        full_output_path = os.path.join(self.enemies_dir, filename)
+        temp_path = full_output_path + ".part"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(image_data)
+            os.replace(temp_path, full_output_path)
+        except OSError as e:
+            # One unwritable sprite mustn't abort the batch; the manifest keeps its previous entry
+            print(f"Failed to save {filename}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return 'failed'
+        self.manifest.entries[url] = entry
+        print(f"Successfully saved {filename}")
+        return 'downloaded'
+
+
+async def scrape_enemy_sprites(html, output_base_dir="templates", manifest_path=None, concurrency=8, retries=3):
+    """
+    Parses enemy sprites out of `html` and downloads them into <output_base_dir>/enemies,
+    skipping sprites that haven't changed since the last run. Returns the outcome counts.
+    """
+    enemies_dir = os.path.join(output_base_dir, "enemies")
+    print(f"Saving enemy sprites to: {os.path.abspath(enemies_dir)}")
+
+    sprites = parse_enemy_sprites(html)
+    print(f"Found {len(sprites)} enemy images to process.")
+
+    manifest = SpriteManifest(manifest_path or default_manifest_path(enemies_dir))
+    downloader = SpriteDownloader(enemies_dir, manifest, concurrency=concurrency, retries=retries)
+    try:
+        counts = await downloader.download_all(sprites)
+    finally:
+        manifest.save()
+    print(f"Finished scraping enemy sprites: {counts['downloaded']} downloaded, {counts['unchanged']} unchanged, "
+          f"{counts['duplicate']} duplicates, {counts['failed']} failed.")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download enemy sprites listed in an HTML page")
+    parser.add_argument("html_file", help="HTML page or table fragment containing img.npc elements")
+    parser.add_argument("--output", default="templates", help="Base directory; sprites go to <output>/enemies")
+    parser.add_argument("--manifest", help="Download manifest (default: <output>/enemies.sprites.json)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum simultaneous downloads")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per sprite on connection errors and 5xx/429")
+
+    args = parser.parse_args()
+
+    with open(args.html_file, encoding='utf-8') as f:
+        html = f.read()
+    asyncio.run(scrape_enemy_sprites(html, args.output, args.manifest, args.concurrency, args.retries))
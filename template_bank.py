@@ -0,0 +1,328 @@
+import hashlib
+import os
+import re
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+
+TEMPLATE_EXTENSIONS = ('.png', '.gif', '.jpg')
+
+# Bump whenever the preprocessing changes so stale caches get rebuilt
+CACHE_VERSION = 4
+
+# Animated GIFs keep at most this many distinct frames per enemy by default
+MAX_FRAMES_PER_ENEMY = 4
+
+# Frames whose mean absolute grayscale difference is at most this are treated as duplicates
+FRAME_DEDUP_TOLERANCE = 4.0
+
+# Cropped frames at least this opaque are matched without a mask: the few transparent pixels
+# barely change the score, and masked matching costs more
+OPAQUE_MASK_SKIP = 0.95
+
+_loaded_banks = {}
+
+
+def default_cache_path(template_dir):
+    """Returns the cache file used for a template directory (e.g. templates/enemies.bank.npz)."""
+    return os.path.normpath(template_dir) + ".bank.npz"
+
+
+def enemy_name_from_filename(filename):
+    """Strips the extension and level suffix (e.g. '_146lvl', '_lvlUnk') from a template filename."""
+    enemy_name = os.path.splitext(filename)[0]
+    return re.sub(r'_(\d+lvl|lvlUnk)$', '', enemy_name)
+
+
+def decode_template_frames(template_path):
+    """
+    Reads a template image and returns its frames as (gray, alpha, bgr) uint8 arrays (all frames
+    of an animated GIF, a single frame otherwise). alpha is 255 for opaque pixels and 0 for
+    transparent ones; bgr is the colour frame. Returns an empty list if the file can't be read.
+    """
+    if template_path.endswith('.gif'):
+        try:
+            with Image.open(template_path) as img:
+                frames = []
+                for frame in ImageSequence.Iterator(img):
+                    # Convert PIL Image to cv2 format, keeping the transparency as a separate mask
+                    img_array = np.array(frame.convert('RGBA'))
+                    gray = cv2.cvtColor(img_array, cv2.COLOR_RGBA2GRAY)
+                    alpha = np.where(img_array[:, :, 3] > 0, 255, 0).astype(np.uint8)
+                    frames.append((gray, alpha, cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGR)))
+                return frames
+        except Exception as e:
+            print(f"Error processing GIF {os.path.basename(template_path)}: {e}")
+            return []
+
+    # For PNG/JPG, read directly (PNGs may carry an alpha channel)
+    template_img = cv2.imread(template_path, cv2.IMREAD_UNCHANGED)
+    if template_img is None:
+        return []
+    if template_img.ndim == 2:
+        return [(template_img, np.full(template_img.shape, 255, np.uint8),
+                 cv2.cvtColor(template_img, cv2.COLOR_GRAY2BGR))]
+    if template_img.shape[2] == 4:
+        alpha = np.where(template_img[:, :, 3] > 0, 255, 0).astype(np.uint8)
+        return [(cv2.cvtColor(template_img, cv2.COLOR_BGRA2GRAY), alpha,
+                 cv2.cvtColor(template_img, cv2.COLOR_BGRA2BGR))]
+    return [(cv2.cvtColor(template_img, cv2.COLOR_BGR2GRAY), np.full(template_img.shape[:2], 255, np.uint8),
+             template_img)]
+
+
+def crop_to_opaque(gray, alpha):
+    """
+    Crops a frame to the bounding box of its opaque pixels. Returns (template, mask), where mask
+    is None if the cropped frame is (almost, see OPAQUE_MASK_SKIP) fully opaque, or None if
+    nothing is opaque.
+    """
+    x, y, w, h = cv2.boundingRect(alpha)
+    if w == 0 or h == 0:
+        return None
+    template = np.ascontiguousarray(gray[y:y + h, x:x + w])
+    mask = np.ascontiguousarray(alpha[y:y + h, x:x + w])
+    return template, (None if np.count_nonzero(mask) >= OPAQUE_MASK_SKIP * mask.size else mask)
+
+
+def select_distinct_frames(frames, max_frames=MAX_FRAMES_PER_ENEMY, tolerance=FRAME_DEDUP_TOLERANCE):
+    """
+    Drops exact and near-duplicate frames, then keeps at most `max_frames` of the rest, picking
+    the ones that differ most from those already kept (the first frame is always kept).
+    Returns the indices of the kept frames in their original order.
+    """
+    unique = []
+    seen = set()
+    for i, frame in enumerate(frames):
+        key = (frame.shape, frame.tobytes())
+        if key not in seen:
+            seen.add(key)
+            unique.append(i)
+
+    def distance(a, b):
+        if frames[a].shape != frames[b].shape:
+            return float('inf')
+        return float(np.mean(cv2.absdiff(frames[a], frames[b])))
+
+    # Farthest-point selection: repeatedly take the frame least similar to everything kept so far
+    kept = [unique[0]] if unique else []
+    closest = {i: distance(i, kept[0]) for i in unique[1:]}
+    while closest and len(kept) < max_frames:
+        candidate = max(closest, key=closest.get)
+        if closest[candidate] <= tolerance:
+            break
+        kept.append(candidate)
+        del closest[candidate]
+        for i in closest:
+            closest[i] = min(closest[i], distance(i, candidate))
+    return sorted(kept)
+
+
+def _template_manifest(template_dir):
+    """Lists template files together with their mtime and size, used as the cache key."""
+    manifest = []
+    for filename in sorted(os.listdir(template_dir)):
+        if not filename.endswith(TEMPLATE_EXTENSIONS):
+            continue
+        stat = os.stat(os.path.join(template_dir, filename))
+        manifest.append(f"{filename}|{stat.st_mtime_ns}|{stat.st_size}")
+    return manifest
+
+
+class TemplateBank:
+    """
+    All enemy templates decoded and converted to grayscale once, stored in a single
+    packed uint8 array. Template i lives at packed[offsets[i]:offsets[i] + h * w]
+    with (h, w) = shapes[i]; indexing the bank returns a 2D view into that array.
+
+    Animated GIFs contribute one template per distinct frame (see select_distinct_frames),
+    so several templates can share a filename; frame_indices tells them apart.
+
+    Templates are cropped to their opaque pixels. Those that still contain transparent pixels
+    have has_mask[i] set and their 0/255 mask stored in packed_masks with the same layout.
+    """
+
+    def __init__(self, filenames, packed, offsets, shapes, template_dir=None, frame_indices=None,
+                 packed_masks=None, has_mask=None):
+        self.template_dir = template_dir
+        self.filenames = list(filenames)
+        if frame_indices is None:
+            frame_indices = np.zeros(len(self.filenames), dtype=np.int32)
+        self.frame_indices = np.asarray(frame_indices, dtype=np.int32)
+        if packed_masks is None:
+            packed_masks = np.full(len(packed), 255, dtype=np.uint8)
+            has_mask = np.zeros(len(self.filenames), dtype=bool)
+        self.packed_masks = np.ascontiguousarray(packed_masks, dtype=np.uint8)
+        self.has_mask = np.asarray(has_mask, dtype=bool)
+        self.packed = np.ascontiguousarray(packed, dtype=np.uint8)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.shapes = np.asarray(shapes, dtype=np.int32).reshape(-1, 2)
+        self.enemy_names = [enemy_name_from_filename(f) for f in self.filenames]
+        self._pyramids = {}
+        self._version = None
+
+    @classmethod
+    def from_templates(cls, filenames, templates, template_dir=None, frame_indices=None, masks=None):
+        """Packs a list of 2D grayscale templates (and their masks, None = opaque) into a bank."""
+        if masks is None:
+            masks = [None] * len(templates)
+        shapes = np.array([t.shape[:2] for t in templates], dtype=np.int32).reshape(-1, 2)
+        sizes = shapes[:, 0].astype(np.int64) * shapes[:, 1]
+        offsets = np.zeros(len(templates), dtype=np.int64)
+        if len(templates) > 1:
+            offsets[1:] = np.cumsum(sizes[:-1])
+        packed = np.empty(int(sizes.sum()), dtype=np.uint8)
+        packed_masks = np.full(int(sizes.sum()), 255, dtype=np.uint8)
+        for offset, size, template, mask in zip(offsets, sizes, templates, masks):
+            packed[offset:offset + size] = template.ravel()
+            if mask is not None:
+                packed_masks[offset:offset + size] = mask.ravel()
+        has_mask = np.array([mask is not None for mask in masks], dtype=bool)
+        return cls(filenames, packed, offsets, shapes, template_dir, frame_indices, packed_masks, has_mask)
+
+    @classmethod
+    def load(cls, template_dir, cache_path=None, use_cache=True, max_frames_per_enemy=MAX_FRAMES_PER_ENEMY,
+             frame_dedup_tolerance=FRAME_DEDUP_TOLERANCE):
+        """
+        Loads every template in template_dir. If a cache file exists and matches the
+        current directory listing (names, mtimes and sizes) it is used instead of decoding.
+
+        Args:
+            template_dir: Directory containing enemy templates
+            cache_path: Path of the .npz cache (defaults to <template_dir>.bank.npz)
+            use_cache: Set to False to always decode and never write the cache
+            max_frames_per_enemy: Upper bound on the frames kept per animated GIF
+            frame_dedup_tolerance: Mean absolute difference below which two frames count as one
+        """
+        if cache_path is None:
+            cache_path = default_cache_path(template_dir)
+        manifest = _template_manifest(template_dir)
+        # The frame selection settings are part of the key, so changing them rebuilds the cache
+        manifest.append(f"frames|{max_frames_per_enemy}|{frame_dedup_tolerance}")
+
+        if use_cache and os.path.exists(cache_path):
+            bank = cls._read_cache(cache_path, manifest, template_dir)
+            if bank is not None:
+                print(f"Loaded {len(bank)} template frames from cache {cache_path}")
+                return bank
+
+        filenames = []
+        templates = []
+        masks = []
+        frame_indices = []
+        decoded_frames = 0
+        for entry in manifest[:-1]:
+            filename = entry.split('|')[0]
+            frames = decode_template_frames(os.path.join(template_dir, filename))
+            if not frames:
+                print(f"Could not read template {filename}")
+                continue
+            decoded_frames += len(frames)
+            # Compare frames with their transparent pixels blanked, so the background doesn't count
+            visible = [np.where(alpha > 0, gray, 0).astype(np.uint8) for gray, alpha, _ in frames]
+            for frame_index in select_distinct_frames(visible, max_frames_per_enemy, frame_dedup_tolerance):
+                cropped = crop_to_opaque(*frames[frame_index][:2])
+                if cropped is None:
+                    continue
+                filenames.append(filename)
+                templates.append(cropped[0])
+                masks.append(cropped[1])
+                frame_indices.append(frame_index)
+
+        bank = cls.from_templates(filenames, templates, template_dir, frame_indices, masks)
+        print(f"Decoded {len(set(filenames))} templates from {template_dir} "
+              f"({len(bank)} of {decoded_frames} frames kept after deduplication)")
+
+        if use_cache:
+            bank._write_cache(cache_path, manifest)
+        return bank
+
+    @classmethod
+    def _read_cache(cls, cache_path, manifest, template_dir):
+        try:
+            with np.load(cache_path) as data:
+                if int(data['version']) != CACHE_VERSION:
+                    return None
+                if data['manifest'].tolist() != manifest:
+                    return None
+                return cls(data['filenames'].tolist(), data['packed'], data['offsets'],
+                           data['shapes'], template_dir, data['frame_indices'],
+                           data['packed_masks'], data['has_mask'])
+        except Exception as e:
+            print(f"Ignoring unreadable template cache {cache_path}: {e}")
+            return None
+
+    def _write_cache(self, cache_path, manifest):
+        try:
+            np.savez(cache_path, version=np.array(CACHE_VERSION), manifest=np.array(manifest),
+                     filenames=np.array(self.filenames), packed=self.packed,
+                     offsets=self.offsets, shapes=self.shapes, frame_indices=self.frame_indices,
+                     packed_masks=self.packed_masks, has_mask=self.has_mask)
+        except Exception as e:
+            print(f"Could not write template cache {cache_path}: {e}")
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, index):
+        h, w = self.shapes[index]
+        offset = self.offsets[index]
+        return self.packed[offset:offset + h * w].reshape(h, w)
+
+    def mask(self, index):
+        """Returns the 0/255 transparency mask of template `index`, or None if it is fully opaque."""
+        if not self.has_mask[index]:
+            return None
+        h, w = self.shapes[index]
+        offset = self.offsets[index]
+        return self.packed_masks[offset:offset + h * w].reshape(h, w)
+
+    def __iter__(self):
+        """Yields (filename, template_gray) pairs, one per kept frame."""
+        for i, filename in enumerate(self.filenames):
+            yield filename, self[i]
+
+    def downscaled(self, level):
+        """
+        Returns (template, mask) pairs reduced `level` times with cv2.pyrDown (each step halves
+        the size). Computed on first use and kept for the lifetime of the bank.
+        """
+        if level == 0:
+            return [(self[i], self.mask(i)) for i in range(len(self))]
+        if level not in self._pyramids:
+            reduced = []
+            for template, mask in self.downscaled(level - 1):
+                if min(template.shape) < 2:
+                    reduced.append((template, mask))
+                    continue
+                if mask is not None:
+                    # Keep a coarse pixel only where it is mostly opaque
+                    mask = np.where(cv2.pyrDown(mask) >= 128, 255, 0).astype(np.uint8)
+                    mask = mask if not mask.all() else None
+                reduced.append((cv2.pyrDown(template), mask))
+            self._pyramids[level] = reduced
+        return self._pyramids[level]
+
+    @property
+    def version(self):
+        """Hash of the bank's contents; two banks with the same templates have the same version."""
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update("\n".join(self.filenames).encode('utf-8'))
+            for array in (self.frame_indices, self.shapes, self.has_mask, self.packed, self.packed_masks):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            self._version = digest.hexdigest()
+        return self._version
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes + self.packed_masks.nbytes
+
+
+def get_template_bank(template_dir):
+    """Returns the bank for template_dir, loading it on first use and reusing it afterwards."""
+    key = os.path.abspath(template_dir)
+    bank = _loaded_banks.get(key)
+    if bank is None:
+        bank = TemplateBank.load(template_dir)
+        _loaded_banks[key] = bank
+    return bank
@@ -0,0 +1,103 @@
+import json
+import os
+import re
+from collections import Counter
+import numpy as np
+from template_bank import enemy_name_from_filename
+
+
+def parse_level(filename):
+    """Returns the level encoded in a template filename ('Adept_19lvl.gif' -> 19), or None for '_lvlUnk'."""
+    match = re.search(r'_(\d+)lvl\.\w+$', filename)
+    return int(match.group(1)) if match else None
+
+
+def default_history_path(template_dir):
+    """Returns the file the location history of a template directory is kept in."""
+    return os.path.normpath(template_dir) + ".locations.json"
+
+
+class TemplateIndex:
+    """
+    Metadata index over a TemplateBank, built from the template filenames (enemy name and level),
+    used to pick which templates are worth matching.
+
+    Besides level filters it keeps named per-location subsets. A subset is either defined
+    explicitly with define_location() or learned from detection history: every detection
+    recorded for a location counts towards its template, and templates seen at least
+    `min_detections` times form the learned subset of that location.
+    """
+
+    def __init__(self, bank, history_path=None, min_detections=2):
+        self.bank = bank
+        self.history_path = history_path
+        self.min_detections = min_detections
+        self.levels = np.array([parse_level(f) or -1 for f in bank.filenames], dtype=np.int32)
+        self.enemy_names = [enemy_name_from_filename(f) for f in bank.filenames]
+        self.locations = {}
+        self.history = {}
+        if history_path and os.path.exists(history_path):
+            self.load(history_path)
+
+    def query(self, min_level=None, max_level=None, include_unknown_level=True, location=None, names=None):
+        """
+        Returns the bank indices of the templates matching every given filter.
+
+        Args:
+            min_level, max_level: Inclusive level range
+            include_unknown_level: Whether '_lvlUnk' templates pass the level range
+            location: Only templates in this location's subset (explicit or learned); a location
+                with no subset yet doesn't filter anything
+            names: Only templates of these enemy names
+        """
+        selected = np.ones(len(self.bank), dtype=bool)
+        known = self.levels >= 0
+        if min_level is not None:
+            selected &= ~known | (self.levels >= min_level)
+        if max_level is not None:
+            selected &= ~known | (self.levels <= max_level)
+        if not include_unknown_level:
+            selected &= known
+        if location is not None:
+            subset = self.location_subset(location)
+            if subset:
+                selected &= np.array([f in subset for f in self.bank.filenames], dtype=bool)
+        if names is not None:
+            names = set(names)
+            selected &= np.array([n in names for n in self.enemy_names], dtype=bool)
+        return np.flatnonzero(selected)
+
+    def define_location(self, location, filenames):
+        """Sets the subset of a location explicitly (it then takes precedence over learned history)."""
+        self.locations[location] = sorted(set(filenames))
+
+    def record_detections(self, location, detections):
+        """Adds the detections found at a location to its history."""
+        counts = self.history.setdefault(location, Counter())
+        counts.update(d['filename'] for d in detections)
+
+    def location_subset(self, location):
+        """Returns the template filenames of a location: the explicit subset, else the learned one."""
+        if location in self.locations:
+            return set(self.locations[location])
+        counts = self.history.get(location, Counter())
+        return {filename for filename, count in counts.items() if count >= self.min_detections}
+
+    def save(self, path=None):
+        path = path or self.history_path
+        data = {
+            'locations': self.locations,
+            'history': {location: dict(counts) for location, counts in self.history.items()},
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def load(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable location history {path}: {e}")
+            return
+        self.locations = data.get('locations', {})
+        self.history = {location: Counter(counts) for location, counts in data.get('history', {}).items()}
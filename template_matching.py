@@ -0,0 +1,583 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import cv2
+import numpy as np
+from fft_matching import FLAT_VARIANCE, CanvasSpectrum, fft_match_template, normalize_scores, zero_flat_windows
+
+MATCH_MODES = ('exhaustive', 'pyramid', 'fft')
+EXECUTOR_KINDS = ('thread', 'process')
+
+# Templates smaller than this (in pixels, at the coarse level) carry too little
+# structure to be scored reliably when downscaled, so they are matched at full resolution.
+MIN_COARSE_TEMPLATE_SIZE = 8
+
+# Float32 masked-window variances (per opaque pixel) are trusted to this fraction of the largest
+# squared (mean-shifted) canvas pixel: OpenCV correlates in blocks through the DFT, so rounding
+# follows the magnitude of the surrounding pixels rather than the window's own.
+FLOAT32_VARIANCE_ERROR = 1e-5
+
+
+class FloatCanvas:
+    """
+    A canvas prepared once per frame for masked matching and shared by every template: its
+    pixels shifted by their mean (masked scores don't depend on a constant offset, and small
+    values keep float32 rounding low) and their squares as float32, for the TM_CCORR
+    correlations, plus float64 integral images for exact box variances. crop() gives the same
+    for a region without recomputing anything.
+    """
+
+    def __init__(self, canvas_gray):
+        self.pixels = canvas_gray.astype(np.float32)
+        self.pixels -= float(self.pixels.mean())
+        self.squares = self.pixels * self.pixels
+        self.variance_error = FLOAT32_VARIANCE_ERROR * float(self.squares.max(initial=0))
+        self.sums, self.square_sums = cv2.integral2(canvas_gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+    def crop(self, y0, y1, x0, x1):
+        cropped = FloatCanvas.__new__(FloatCanvas)
+        cropped.pixels = self.pixels[y0:y1, x0:x1]
+        cropped.squares = self.squares[y0:y1, x0:x1]
+        cropped.variance_error = self.variance_error
+        # Box sums only use differences of the tables, so a slice of them serves the crop
+        cropped.sums = self.sums[y0:y1 + 1, x0:x1 + 1]
+        cropped.square_sums = self.square_sums[y0:y1 + 1, x0:x1 + 1]
+        return cropped
+
+    def box_variance(self, ys, xs, template_shape):
+        """
+        Exact sums of squared deviations over the template-sized boxes at (ys, xs). A masked
+        window's variance is never larger than its whole box's.
+        """
+        template_h, template_w = template_shape
+
+        def box(table):
+            return (table[ys + template_h, xs + template_w] - table[ys, xs + template_w]
+                    - table[ys + template_h, xs] + table[ys, xs])
+
+        sums = box(self.sums)
+        return box(self.square_sums) - sums * sums / (template_h * template_w)
+
+
+def match_template(canvas_gray, template_gray, mask=None, canvas_float=None):
+    """
+    TM_CCOEFF_NORMED response map of one template, restricted to its opaque pixels when a
+    mask is given.
+
+    OpenCV's masked TM_CCOEFF_NORMED costs 4-6x the unmasked call, so masked scores are
+    assembled from three plain TM_CCORR correlations instead (about 2x): the canvas with the
+    mean-centred, masked template, and the canvas and its squares with the mask, which give
+    each window's mean and variance under the mask. Pass `canvas_float` (a FloatCanvas of the
+    canvas, or a crop of it) to share that preparation between templates.
+
+    Windows that are flat under the mask (fft_matching.zero_flat_windows) score 0, as in the FFT
+    engine; OpenCV only zeroes exactly flat windows. Elsewhere the scores equal the FFT engine's
+    and OpenCV's up to float32 rounding, which stays below 1e-5 on textured or evenly lit
+    canvases. It grows (to about 1e-2) only in nearly flat windows of a canvas that also has
+    much brighter or darker regions, where scores carry no match anyway.
+    """
+    if mask is None:
+        return cv2.matchTemplate(canvas_gray, template_gray, cv2.TM_CCOEFF_NORMED)
+    canvas = canvas_float if canvas_float is not None else FloatCanvas(canvas_gray)
+    weights = (mask > 0).astype(np.float32)
+    count = float(weights.sum())
+    template = template_gray.astype(np.float64)
+    template = (template - (template * weights).sum() / count) * weights
+    numerator = cv2.matchTemplate(canvas.pixels, template.astype(np.float32), cv2.TM_CCORR)
+    sums = cv2.matchTemplate(canvas.pixels, weights, cv2.TM_CCORR)
+    square_sums = cv2.matchTemplate(canvas.squares, weights, cv2.TM_CCORR)
+    canvas_variance = square_sums - sums * sums / count
+
+    # Rounding can lift a flat window (e.g. a uniform UI panel far from the canvas mean) just
+    # above the flat limit; its exact box variance settles whether it really is flat
+    flat_limit = FLAT_VARIANCE * count
+    ys, xs = np.nonzero((canvas_variance >= flat_limit)
+                        & (canvas_variance < flat_limit + canvas.variance_error * count))
+    if len(ys):
+        flat = canvas.box_variance(ys, xs, template.shape) < flat_limit
+        canvas_variance[ys[flat], xs[flat]] = 0
+    canvas_variance = zero_flat_windows(canvas_variance, count)
+    return normalize_scores(numerator, canvas_variance, float(np.sqrt((template * template).sum())))
+
+
+def extract_peaks(res, threshold, template_shape):
+    """
+    Returns (xs, ys, scores) of the local maxima in a response map that reach `threshold`.
+    A pixel is a peak when it is the maximum of a window a quarter of the template size, so
+    the plateau of near-identical scores around a sprite collapses to a single position.
+    """
+    radius = max(1, min(template_shape) // 4)
+    kernel = np.ones((2 * radius + 1, 2 * radius + 1), np.uint8)
+    local_max = cv2.dilate(res, kernel)
+    ys, xs = np.nonzero((res >= threshold) & (res >= local_max))
+    return xs, ys, res[ys, xs]
+
+
+class _PeakCollector:
+    """Accumulates peaks from many response maps as arrays, without building dicts per hit."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def add(self, res, threshold, index, template_shape, offset=(0, 0)):
+        xs, ys, scores = extract_peaks(res, threshold, template_shape)
+        if len(scores) == 0:
+            return
+        boxes = np.empty((len(scores), 4), dtype=np.float32)
+        boxes[:, 0] = xs + offset[0]
+        boxes[:, 1] = ys + offset[1]
+        boxes[:, 2] = template_shape[1]
+        boxes[:, 3] = template_shape[0]
+        self._chunks.append((boxes, scores.astype(np.float32), np.full(len(scores), index, np.int32)))
+
+    def arrays(self):
+        """Returns (boxes as x, y, w, h rows; scores; template indices)."""
+        return _concat_peaks(self._chunks)
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def result_box(result):
+    """The (x, y, w, h) box of a result dict."""
+    return (*result['position'], result['width'], result['height'])
+
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3):
+    """
+    Greedy non-maximum suppression over (x, y, w, h) boxes, regardless of which template
+    produced them. Returns the indices of the kept boxes, highest score first.
+    """
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x1[best], x1[rest]) - np.maximum(x0[best], x0[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y1[best], y1[rest]) - np.maximum(y0[best], y0[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[best] + areas[rest] - inter)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def suppress_overlapping_results(results, iou_threshold=0.3):
+    """Applies non_max_suppression to a list of result dicts, e.g. detections merged from several passes."""
+    if not results:
+        return []
+    boxes = np.array([result_box(r) for r in results], dtype=np.float32)
+    scores = np.array([r['confidence'] for r in results], dtype=np.float32)
+    return [results[k] for k in non_max_suppression(boxes, scores, iou_threshold)]
+
+
+def _concat_peaks(chunks):
+    chunks = [chunk for chunk in chunks if len(chunk[1])]
+    if not chunks:
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.int32)
+    boxes, scores, indices = zip(*chunks)
+    return np.concatenate(boxes), np.concatenate(scores), np.concatenate(indices)
+
+
+def _detections_to_results(bank, boxes, scores, indices, nms_iou):
+    """Runs NMS over the collected peaks and turns the survivors into result dicts."""
+    # Order by template first so equal scores resolve the same way however the work was sharded
+    order = np.argsort(indices, kind='stable')
+    boxes, scores, indices = boxes[order], scores[order], indices[order]
+    results = []
+    for k in non_max_suppression(boxes, scores, nms_iou):
+        i = indices[k]
+        results.append({
+            'name': bank.enemy_names[i],
+            'filename': bank.filenames[i],
+            'frame': int(bank.frame_indices[i]),  # which GIF frame matched
+            'position': (int(boxes[k, 0]), int(boxes[k, 1])),  # (x, y) coordinates
+            'confidence': float(scores[k]),
+            'width': int(boxes[k, 2]),
+            'height': int(boxes[k, 3])
+        })
+    return results
+
+
+def _exhaustive_peaks(canvas_gray, offset, bank, indices, threshold, use_masks, peaks):
+    canvas_h, canvas_w = canvas_gray.shape[:2]
+    canvas_float = FloatCanvas(canvas_gray) if use_masks else None
+    for i in indices:
+        template_gray = bank[i]
+        if template_gray.shape[0] > canvas_h or template_gray.shape[1] > canvas_w:
+            continue
+        res = match_template(canvas_gray, template_gray, bank.mask(i) if use_masks else None, canvas_float)
+        peaks.add(res, threshold, i, template_gray.shape, offset)
+
+
+def _fft_peaks(spectrum, offset, bank, indices, threshold, use_masks, peaks):
+    canvas_h, canvas_w = spectrum.shape
+    for i in indices:
+        template_gray = bank[i]
+        if template_gray.shape[0] > canvas_h or template_gray.shape[1] > canvas_w:
+            continue
+        res = fft_match_template(spectrum, template_gray, bank.mask(i) if use_masks else None)
+        peaks.add(res, threshold, i, template_gray.shape, offset)
+
+
+def _pyramid_peaks(canvas_gray, coarse_canvas, offset, bank, indices, threshold, pyramid_levels, coarse_margin,
+                   use_masks, peaks):
+    scale = 2 ** pyramid_levels
+    # How far a full-resolution position can be from its coarse estimate
+    pad = scale
+
+    coarse_templates = bank.downscaled(pyramid_levels)
+    canvas_h, canvas_w = canvas_gray.shape[:2]
+    coarse_threshold = threshold - coarse_margin
+    # Converted once for all templates; full-resolution crops are slices of it
+    canvas_float = FloatCanvas(canvas_gray) if use_masks else None
+    coarse_float = FloatCanvas(coarse_canvas) if use_masks else None
+
+    for i in indices:
+        template_gray = bank[i]
+        template_mask = bank.mask(i) if use_masks else None
+        template_h, template_w = template_gray.shape
+        if template_h > canvas_h or template_w > canvas_w:
+            continue
+
+        coarse_template, coarse_mask = coarse_templates[i]
+        if not use_masks:
+            coarse_mask = None
+        if (min(coarse_template.shape) < MIN_COARSE_TEMPLATE_SIZE
+                or coarse_template.shape[0] > coarse_canvas.shape[0]
+                or coarse_template.shape[1] > coarse_canvas.shape[1]
+                or (coarse_mask is not None and not coarse_mask.any())):
+            res = match_template(canvas_gray, template_gray, template_mask, canvas_float)
+            peaks.add(res, threshold, i, template_gray.shape, offset)
+            continue
+
+        coarse_res = match_template(coarse_canvas, coarse_template, coarse_mask, coarse_float)
+        candidates = (coarse_res >= coarse_threshold).astype(np.uint8)
+        if not candidates.any():
+            continue
+
+        # Merge neighbouring candidate pixels into regions so each is refined with one call
+        candidates = cv2.dilate(candidates, np.ones((3, 3), np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(candidates, connectivity=8)
+        for x, y, w, h, _ in stats[1:count]:
+            x0 = max(x * scale - pad, 0)
+            y0 = max(y * scale - pad, 0)
+            x1 = min((x + w - 1) * scale + pad + template_w, canvas_w)
+            y1 = min((y + h - 1) * scale + pad + template_h, canvas_h)
+            if x1 - x0 < template_w or y1 - y0 < template_h:
+                continue
+            crop_float = None if canvas_float is None else canvas_float.crop(y0, y1, x0, x1)
+            res = match_template(canvas_gray[y0:y1, x0:x1], template_gray, template_mask, crop_float)
+            peaks.add(res, threshold, i, template_gray.shape, (offset[0] + x0, offset[1] + y0))
+
+
+def _coarse_canvas(canvas_gray, pyramid_levels):
+    coarse_canvas = canvas_gray
+    for _ in range(pyramid_levels):
+        coarse_canvas = cv2.pyrDown(coarse_canvas)
+    return coarse_canvas
+
+
+def _search_areas(canvas_gray, regions, mode, options):
+    """
+    Returns (offset, canvas crop, prepared crop) for every area to search: the whole canvas, or
+    each of `regions` given as (x, y, w, h). The prepared crop is the coarse canvas in pyramid
+    mode and the CanvasSpectrum in fft mode, so it is computed once and shared by all templates.
+    In pyramid mode crops start on multiples of the pyramid scale so their coarse pixels line
+    up with the full canvas' ones.
+    """
+    pyramid_levels = options['pyramid_levels'] if mode == 'pyramid' else 0
+    if regions is None:
+        regions = [(0, 0, canvas_gray.shape[1], canvas_gray.shape[0])]
+
+    scale = 2 ** pyramid_levels
+    areas = []
+    for x, y, w, h in regions:
+        x0, y0 = (max(int(x), 0) // scale) * scale, (max(int(y), 0) // scale) * scale
+        x1, y1 = min(int(x + w), canvas_gray.shape[1]), min(int(y + h), canvas_gray.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            continue
+        crop = canvas_gray[y0:y1, x0:x1]
+        if mode == 'pyramid':
+            prepared = _coarse_canvas(crop, pyramid_levels)
+        elif mode == 'fft':
+            prepared = CanvasSpectrum(crop)
+        else:
+            prepared = None
+        areas.append(((x0, y0), crop, prepared))
+    return areas
+
+
+def _match_shard(areas, bank, indices, threshold, mode, options):
+    """
+    Matches the templates listed in `indices` in every area and returns their peaks as arrays.
+    With a `profiler` option (e.g. StageTimer) the time spent on each template is reported to
+    profiler.record_template().
+    """
+    peaks = _PeakCollector()
+    profiler = options.get('profiler')
+
+    def match(offset, canvas_gray, prepared, template_indices):
+        if mode == 'exhaustive':
+            _exhaustive_peaks(canvas_gray, offset, bank, template_indices, threshold, options['use_masks'], peaks)
+        elif mode == 'fft':
+            _fft_peaks(prepared, offset, bank, template_indices, threshold, options['use_masks'], peaks)
+        else:
+            _pyramid_peaks(canvas_gray, prepared, offset, bank, template_indices, threshold,
+                           options['pyramid_levels'], options['coarse_margin'], options['use_masks'], peaks)
+
+    for offset, canvas_gray, prepared in areas:
+        if profiler is None:
+            match(offset, canvas_gray, prepared, indices)
+            continue
+        for i in indices:
+            start = time.perf_counter()
+            match(offset, canvas_gray, prepared, [i])
+            profiler.record_template(f"{bank.filenames[i]}#{bank.frame_indices[i]}", time.perf_counter() - start)
+    return peaks.arrays()
+
+
+# Bank held by each worker of a process pool (set once by the pool initializer)
+_process_bank = None
+
+
+def init_process_worker(bank):
+    """Process pool initializer: keeps `bank` for the worker's tasks (see process_worker_bank)."""
+    global _process_bank
+    _process_bank = bank
+    # Each process already is one worker; don't let OpenCV spawn threads on top of that
+    cv2.setNumThreads(1)
+
+
+def process_worker_bank():
+    """The bank given to init_process_worker in this worker process."""
+    return _process_bank
+
+
+def _match_shard_in_process(areas, indices, threshold, mode, options):
+    return _match_shard(areas, _process_bank, indices, threshold, mode, options)
+
+
+_executors = {}
+
+
+def get_executor(workers, kind='thread', bank=None):
+    """
+    Returns a pool with `workers` workers, created on first use and reused afterwards.
+    Thread pools work well because cv2.matchTemplate releases the GIL; process pools keep their
+    own copy of `bank` (sent once, when the pool starts) and only receive the canvas per call.
+    """
+    if kind not in EXECUTOR_KINDS:
+        raise ValueError(f"Unknown executor kind {kind!r}, expected one of {EXECUTOR_KINDS}")
+    key = (kind, workers, id(bank) if kind == 'process' else None)
+    executor = _executors.get(key)
+    if executor is None:
+        if kind == 'thread':
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='matcher')
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_process_worker, initargs=(bank,))
+        _executors[key] = executor
+    return executor
+
+
+def shutdown_executors():
+    """Shuts down every pool created by get_executor."""
+    for executor in _executors.values():
+        executor.shutdown(wait=True)
+    _executors.clear()
+
+
+def shard_templates(bank, indices, shards):
+    """
+    Splits template indices into `shards` groups of roughly equal matching cost: templates are
+    sorted by area and dealt out round-robin, so every shard gets a mix of large and small ones.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    areas = bank.shapes[indices, 0].astype(np.int64) * bank.shapes[indices, 1]
+    ordered = indices[np.argsort(-areas, kind='stable')]
+    return [ordered[k::shards].tolist() for k in range(shards) if k < len(ordered)]
+
+
+def match_templates(canvas_gray, bank, threshold=0.7, mode='exhaustive', workers=1, executor='thread',
+                    regions=None, template_indices=None, **options):
+    """
+    Matches every template of the bank against a grayscale canvas.
+
+    Args:
+        canvas_gray: Grayscale canvas as a uint8 array
+        bank: TemplateBank with the enemy templates
+        threshold: Matching threshold (0.0 to 1.0)
+        mode: 'exhaustive', 'pyramid' (see match_pyramid for its options) or 'fft' (see match_fft)
+        workers: Number of workers the templates are sharded across (1 = match in this thread)
+        executor: 'thread' or 'process' pool used when workers > 1
+        regions: Optional list of (x, y, w, h) canvas regions to search instead of the whole
+            canvas; a sprite is only found if it lies entirely inside one region
+        template_indices: Optional subset of bank indices to match (e.g. from TemplateIndex.query)
+
+    Templates with transparent pixels are matched with their mask, so only the sprite itself is
+    compared (pass use_masks=False to match the full rectangle).
+    A `profiler` option (e.g. instrumentation.StageTimer) receives the cost of every template.
+
+    Local maxima of every response map are merged across templates with non-maximum
+    suppression (`nms_iou` option, default 0.3), so each sprite yields one detection.
+
+    Returns a list of dicts with 'name', 'filename', 'frame', 'position', 'confidence', 'width'
+    and 'height', sorted by confidence (highest first).
+    """
+    nms_iou = options.pop('nms_iou', 0.3)
+    boxes, scores, template_indices = _collect_peaks(canvas_gray, bank, threshold, mode, workers, executor, regions,
+                                                     template_indices, options)
+    # NMS returns detections highest score first
+    return _detections_to_results(bank, boxes, scores, template_indices, nms_iou)
+
+
+def _collect_peaks(canvas_gray, bank, threshold, mode, workers, executor, regions, template_indices, options):
+    """Matches the templates (see match_templates) and returns all their peaks, before NMS."""
+    if mode not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode {mode!r}, expected one of {MATCH_MODES}")
+    options = {'use_masks': True, **options}
+    if mode == 'pyramid':
+        options = {'pyramid_levels': 1, 'coarse_margin': 0.15, **options}
+        # Build the downscaled templates up front rather than racing to do it in every worker
+        bank.downscaled(options['pyramid_levels'])
+    areas = _search_areas(canvas_gray, regions, mode, options)
+
+    indices = range(len(bank)) if template_indices is None else template_indices
+    if workers <= 1:
+        boxes, scores, template_indices = _match_shard(areas, bank, indices, threshold, mode, options)
+    else:
+        pool = get_executor(workers, executor, bank)
+        if executor == 'process':
+            # Worker processes can't report back to an in-process profiler
+            options = {k: v for k, v in options.items() if k != 'profiler'}
+            futures = [pool.submit(_match_shard_in_process, areas, shard, threshold, mode, options)
+                       for shard in shard_templates(bank, indices, workers)]
+        else:
+            futures = [pool.submit(_match_shard, areas, bank, shard, threshold, mode, options)
+                       for shard in shard_templates(bank, indices, workers)]
+        boxes, scores, template_indices = _concat_peaks([f.result() for f in futures])
+    return boxes, scores, template_indices
+
+
+def match_threshold_sweep(canvas_gray, bank, thresholds, mode='exhaustive', workers=1, executor='thread',
+                          regions=None, template_indices=None, **options):
+    """
+    Returns {threshold: match_templates results} for several thresholds while matching only once.
+
+    Every response map is computed a single time, at the lowest threshold; the peaks of a local
+    maximum don't depend on the threshold, so each threshold just keeps the peaks reaching it
+    before NMS runs. For 'exhaustive' and 'fft' this gives exactly the results of separate
+    match_templates calls. In 'pyramid' mode the coarse pass also runs at the lowest threshold,
+    so higher thresholds may find sprites a separate call would have missed, never fewer.
+    """
+    nms_iou = options.pop('nms_iou', 0.3)
+    boxes, scores, indices = _collect_peaks(canvas_gray, bank, min(thresholds), mode, workers, executor, regions,
+                                            template_indices, options)
+    sweep = {}
+    for threshold in thresholds:
+        kept = scores >= threshold
+        sweep[threshold] = _detections_to_results(bank, boxes[kept], scores[kept], indices[kept], nms_iou)
+    return sweep
+
+
+async def match_templates_async(canvas_gray, bank, threshold=0.7, mode='exhaustive', workers=1, **options):
+    """
+    Awaitable match_templates: the match runs on the event loop's default executor, so browser
+    I/O keeps going while a frame is analysed. Shards still go to the `workers`-sized pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(match_templates, canvas_gray, bank, threshold, mode=mode, workers=workers, **options))
+
+
+def match_exhaustive(canvas_gray, bank, threshold=0.7, **options):
+    """Runs full-resolution (masked) TM_CCOEFF_NORMED for every template over the whole canvas."""
+    return match_templates(canvas_gray, bank, threshold, mode='exhaustive', **options)
+
+
+def match_pyramid(canvas_gray, bank, threshold=0.7, pyramid_levels=1, coarse_margin=0.15, **options):
+    """
+    Coarse-to-fine matching. Every template is first scored against the canvas reduced
+    `pyramid_levels` times; positions scoring at least `threshold - coarse_margin` there are
+    grouped into candidate regions, and only those regions are re-matched at full resolution.
+
+    `coarse_margin` is the accuracy/speed knob: a larger margin lets more coarse candidates
+    through (higher recall, more refinement work), a smaller one prunes harder.
+    """
+    return match_templates(canvas_gray, bank, threshold, mode='pyramid', pyramid_levels=pyramid_levels,
+                           coarse_margin=coarse_margin, **options)
+
+
+def match_fft(canvas_gray, bank, threshold=0.7, **options):
+    """
+    Same scores as match_exhaustive, computed in the frequency domain: the canvas DFTs and
+    running-sum tables are built once per frame (see fft_matching.CanvasSpectrum), leaving
+    each template with its own DFTs and a few inverse DFTs. For small sprites on a game-sized
+    canvas this is slower than the spatial engine; it pays off for large templates.
+    """
+    return match_templates(canvas_gray, bank, threshold, mode='fft', **options)
+
+
+def measure_worker_throughput(canvas_gray, bank, worker_counts, threshold=0.7, mode='exhaustive',
+                              executor='thread', repeats=3, **options):
+    """
+    Times match_templates for each worker count and reports frames/sec and templates/sec.
+    The first run per worker count is a warm-up (pool start-up) and isn't timed.
+    """
+    report = []
+    for workers in worker_counts:
+        match_templates(canvas_gray, bank, threshold, mode, workers, executor, **options)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            match_templates(canvas_gray, bank, threshold, mode, workers, executor, **options)
+        seconds_per_frame = (time.perf_counter() - start) / repeats
+        report.append({
+            'workers': workers,
+            'executor': executor,
+            'seconds_per_frame': seconds_per_frame,
+            'frames_per_second': 1.0 / seconds_per_frame,
+            'templates_per_second': len(bank) / seconds_per_frame,  # counts every kept GIF frame
+        })
+    return report
+
+
+def count_matched(expected, found, iou_threshold=0.5):
+    """Counts detections in `expected` with a same-template detection in `found` overlapping it by `iou_threshold`."""
+    return sum(
+        any(e['filename'] == f['filename'] and box_iou(result_box(e), result_box(f)) >= iou_threshold for f in found)
+        for e in expected
+    )
+
+
+def compare_recall(canvas_gray, bank, threshold=0.7, **pyramid_options):
+    """
+    Runs the exhaustive and pyramid matchers on the same canvas and reports how many of the
+    exhaustive detections the pyramid matcher also found, together with the time each took.
+    """
+    start = time.perf_counter()
+    exhaustive = match_exhaustive(canvas_gray, bank, threshold)
+    exhaustive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pyramid = match_pyramid(canvas_gray, bank, threshold, **pyramid_options)
+    pyramid_time = time.perf_counter() - start
+
+    recall = count_matched(exhaustive, pyramid) / len(exhaustive) if exhaustive else 1.0
+
+    return {
+        'recall': recall,
+        'exhaustive_matches': len(exhaustive),
+        'pyramid_matches': len(pyramid),
+        'exhaustive_seconds': exhaustive_time,
+        'pyramid_seconds': pyramid_time,
+        'speedup': exhaustive_time / pyramid_time if pyramid_time > 0 else float('inf'),
+    }
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import cv2
+import numpy as np
+from template_matching import box_iou, match_template, match_templates, result_box
+
+
+def _center_distance(a, b):
+    return float(np.hypot(a[0] + a[2] / 2 - b[0] - b[2] / 2, a[1] + a[3] / 2 - b[1] - b[3] / 2))
+
+
+class Track:
+    """One enemy followed across frames; `track_id` stays the same for as long as it is tracked."""
+
+    def __init__(self, track_id, detection, template_index):
+        self.track_id = track_id
+        self.hits = 0
+        self.misses = 0
+        self.update(detection, template_index)
+
+    def update(self, detection, template_index):
+        self.detection = dict(detection)
+        self.template_index = template_index
+        self.hits += 1
+        self.misses = 0
+
+    @property
+    def box(self):
+        return result_box(self.detection)
+
+    def to_detection(self):
+        return {**self.detection, 'track_id': self.track_id}
+
+
+class EnemyTracker:
+    """
+    Follows detected enemies across frames so a full detection isn't needed on every one.
+
+    On most frames every track is only re-verified: the frames of its enemy's template are
+    matched in a window `search_margin` pixels around its last box, which costs a fraction of
+    a full scan. Full detection (`detect`, e.g. IncrementalDetector.detect) runs every
+    `full_detection_interval` frames, when there are no tracks, and right after a track was
+    lost; its detections are associated with the existing tracks by IoU, or by centre distance
+    for enemies that moved further, so known enemies keep their track id.
+
+    Args:
+        bank: TemplateBank the detections refer to
+        detect: Callable returning match_templates-style detections for a grayscale frame
+            (defaults to a full match_templates scan)
+        threshold: Score a track's template must reach in its window to stay verified
+        max_misses: Consecutive failed verifications before a track is dropped
+        iou_threshold: Minimum overlap for a detection to continue a track
+        max_center_distance: Otherwise, the largest centre distance (in multiples of the
+            sprite size) for a same-enemy detection to continue a track
+    """
+
+    def __init__(self, bank, detect=None, threshold=0.7, full_detection_interval=10, search_margin=32,
+                 max_misses=2, iou_threshold=0.3, max_center_distance=1.0, use_masks=True):
+        self.bank = bank
+        self.detect = detect or (lambda canvas_gray: match_templates(canvas_gray, bank, threshold))
+        self.threshold = threshold
+        self.full_detection_interval = full_detection_interval
+        self.search_margin = search_margin
+        self.max_misses = max_misses
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.use_masks = use_masks
+        self.tracks = []
+        self.frames_since_full_detection = 0
+        self._track_lost = False
+        self._next_id = itertools.count(1)
+        # Template indices of every kept frame of each file, to re-verify animated sprites
+        self._frames_of = {}
+        for i, filename in enumerate(bank.filenames):
+            self._frames_of.setdefault(filename, []).append(i)
+        # Details of the last update() call, for logging
+        self.last_update = None
+
+    def reset(self):
+        """Drops every track, so the next frame gets a full detection."""
+        self.tracks = []
+        self._track_lost = False
+
+    @property
+    def next_update_full(self):
+        """Whether the next update() runs full detection (e.g. to pick the templates it should use)."""
+        return (not self.tracks or self._track_lost
+                or self.frames_since_full_detection + 1 >= self.full_detection_interval)
+
+    def update(self, canvas_image):
+        """Returns the tracked enemies in a frame: detection dicts with an added 'track_id'."""
+        canvas_gray = cv2.cvtColor(canvas_image, cv2.COLOR_BGR2GRAY) if canvas_image.ndim == 3 else canvas_image
+
+        full = self.next_update_full
+        if full:
+            self._associate(self.detect(canvas_gray))
+            self.frames_since_full_detection = 0
+            self._track_lost = False
+        else:
+            self.frames_since_full_detection += 1
+            for track in self.tracks:
+                self._verify(track, canvas_gray)
+            kept = [t for t in self.tracks if t.misses <= self.max_misses]
+            self._track_lost = len(kept) < len(self.tracks)
+            self.tracks = kept
+
+        self.last_update = {'full': full, 'tracks': len(self.tracks)}
+        return [t.to_detection() for t in self.tracks if t.misses == 0]
+
+    async def update_async(self, canvas_image):
+        """update() run on the event loop's default executor so the loop isn't blocked."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.update, canvas_image)
+
+    def _verify(self, track, canvas_gray):
+        """Re-finds a track near its last box with its enemy's templates; counts a miss if it's gone."""
+        canvas_h, canvas_w = canvas_gray.shape[:2]
+        x, y, w, h = track.box
+        x0, y0 = max(x - self.search_margin, 0), max(y - self.search_margin, 0)
+        best = None
+        for i in self._frames_of[track.detection['filename']]:
+            template_gray = self.bank[i]
+            template_h, template_w = template_gray.shape
+            x1 = min(x0 + w + 2 * self.search_margin, canvas_w)
+            y1 = min(y0 + h + 2 * self.search_margin, canvas_h)
+            x1, y1 = max(x1, x0 + template_w), max(y1, y0 + template_h)
+            if x1 > canvas_w or y1 > canvas_h:
+                continue
+            res = match_template(canvas_gray[y0:y1, x0:x1], template_gray, self.bank.mask(i) if self.use_masks else None)
+            _, score, _, (px, py) = cv2.minMaxLoc(res)
+            if best is None or score > best[0]:
+                best = (score, i, (x0 + px, y0 + py), template_gray.shape)
+
+        if best is None or best[0] < self.threshold:
+            track.misses += 1
+            return
+        score, i, position, (template_h, template_w) = best
+        track.update({**track.detection, 'frame': int(self.bank.frame_indices[i]), 'position': position,
+                      'confidence': float(score), 'width': template_w, 'height': template_h}, i)
+
+    def _associate(self, detections):
+        """Continues tracks with matching detections, starts tracks for the rest and ages the others."""
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            for d, detection in enumerate(detections):
+                if detection['filename'] != track.detection['filename']:
+                    continue
+                box = result_box(detection)
+                iou = box_iou(track.box, box)
+                distance = _center_distance(track.box, box)
+                if iou >= self.iou_threshold or distance <= self.max_center_distance * max(box[2], box[3]):
+                    pairs.append((-iou, distance, t, d))
+
+        matched_tracks, matched_detections = set(), set()
+        for _, _, t, d in sorted(pairs):
+            if t in matched_tracks or d in matched_detections:
+                continue
+            matched_tracks.add(t)
+            matched_detections.add(d)
+            self.tracks[t].update(detections[d], self._template_index(detections[d]))
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                self.tracks.append(Track(next(self._next_id), detection, self._template_index(detection)))
+
+    def _template_index(self, detection):
+        for i in self._frames_of[detection['filename']]:
+            if self.bank.frame_indices[i] == detection['frame']:
+                return i
+        return self._frames_of[detection['filename']][0]
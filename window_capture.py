@@ -1,3 +1,7 @@
+import argparse
+import time
+import cv2
+import numpy as np
 import pygetwindow as gw
 import mss
 import mss.tools
@@ -23,76 +27,166 @@ def list_and_select_window():
             print("Invalid choice. Please enter a valid number from the list.")
 
 
+class WindowCapture:
+    """
+    Captures a desktop window repeatedly through one open mss handle. grab() returns the window
+    as an (h, w, 4) BGRA NumPy view over mss' raw buffer - no PNG encoding and no copy - which
+    the template matchers accept like a BGR frame.
+
+    The window geometry is cached and only re-queried every `geometry_interval` seconds, so a
+    moved or resized window is picked up without asking the window manager on every frame.
+    mss handles are tied to the thread that created them: use one WindowCapture per thread.
+    """
+
+    def __init__(self, window_title, geometry_interval=0.5):
+        self.window_title = window_title
+        self.geometry_interval = geometry_interval
+        self.captured_frames = 0
+        self.dropped_frames = 0
+        self._sct = mss.mss()
+        self._window = None
+        self._monitor = None
+        self._geometry_checked = 0.0
+
+    def close(self):
+        self._sct.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _find_window(self):
+        windows = gw.getWindowsWithTitle(self.window_title)
+        # Take the first window if multiple have the same title
+        return windows[0] if windows else None
+
+    def monitor(self):
+        """
+        Returns the mss region {'top', 'left', 'width', 'height'} of the window, re-reading the
+        geometry when the cached one is older than geometry_interval; None if the window is
+        gone, minimized or has no area.
+        """
+        now = time.perf_counter()
+        if self._monitor is not None and now - self._geometry_checked < self.geometry_interval:
+            return self._monitor
+        self._geometry_checked = now
+
+        try:
+            if self._window is None:
+                self._window = self._find_window()
+            if self._window is None or self._window.isMinimized:
+                self._monitor = None
+                return None
+            region = {"top": self._window.top, "left": self._window.left,
+                      "width": self._window.width, "height": self._window.height}
+        except Exception as e:
+            # The window was closed; look it up again next time
+            print(f"Lost window '{self.window_title}': {e}")
+            self._window = self._monitor = None
+            return None
+
+        self._monitor = region if region["width"] > 0 and region["height"] > 0 else None
+        return self._monitor
+
+    def grab(self):
+        """Returns the window as a BGRA array (view over the mss buffer), or None if it can't be captured."""
+        monitor = self.monitor()
+        if monitor is None:
+            return None
+        shot = self._sct.grab(monitor)
+        self.captured_frames += 1
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def frames(self, fps=30.0):
+        """
+        Generator of window frames at up to `fps` frames per second. A new frame is grabbed only
+        when the consumer asks for it, so a slow consumer gets the current window contents and
+        the frames it missed are counted in dropped_frames instead of queuing up.
+        """
+        interval = 1.0 / fps if fps else 0.0
+        next_due = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now < next_due:
+                time.sleep(next_due - now)
+            elif interval:
+                self.dropped_frames += int((now - next_due) / interval)
+            next_due = max(now, next_due) + interval
+            frame = self.grab()
+            if frame is not None:
+                yield frame
+
+
 def capture_selected_window(window_title):
     """Captures a screenshot of the specified window."""
     try:
-        # Get the specific window by title
-        win = gw.getWindowsWithTitle(window_title)
-        if not win:
-            print(f"Error: Window with title '{window_title}' not found.")
-            return False
-        
-        # Get the first window if multiple have the same title
-        target_window = win[0]
-
-        # ADD DEBUG PRINTS HERE
-        print("\n--- DEBUG INFO START ---")
-        print(f"DEBUG: Target window object raw: {target_window}")
-        try:
-            print(f"DEBUG: Window Title: '{target_window.title}'")
-            print(f"DEBUG: Is Minimized: {target_window.isMinimized}")
-            print(f"DEBUG: Is Maximized: {target_window.isMaximized}")
-            print(f"DEBUG: Is Active: {target_window.isActive}")
-            print(f"DEBUG: Position (L,T): ({target_window.left}, {target_window.top})")
-            print(f"DEBUG: Size (W,H): ({target_window.width}, {target_window.height})")
-            print(f"DEBUG: Box (L,T,R,B): {target_window.box}")
-        except Exception as e_debug:
-            print(f"DEBUG: Error accessing some window properties: {e_debug}")
-
-        # Activate the window (optional, but can help ensure it's drawn correctly)
-        # try:
-        #     target_window.activate()
-        # except Exception as e:
-        #     print(f"Could not activate window: {e} (continuing anyway)")
-
-        # Get window geometry
-        # Ensure the window is not minimized for accurate geometry
-        if target_window.isMinimized:
-            print("DEBUG: Window is minimized, attempting to restore...")
-            target_window.restore()
-            # Add a small delay to allow the window to restore
-            import time
-            time.sleep(0.5) # Allow time for window to restore and geometry to update
-            print(f"DEBUG: Geometry after restore attempt: L:{target_window.left}, T:{target_window.top}, W:{target_window.width}, H:{target_window.height}, Box:{target_window.box}")
-            
-        x, y, width, height = target_window.left, target_window.top, target_window.width, target_window.height
-        print(f"DEBUG: Using coordinates for MSS: Left={x}, Top={y}, Width={width}, Height={height}")
-
-        if width <= 0 or height <= 0:
-            print(f"Error: Window '{window_title}' has invalid dimensions (width: {width}, height: {height}). It might be minimized, not rendered, or an issue with geometry reporting.")
-            print("--- DEBUG INFO END ---\n")
-            return False
-
-        print(f"Capturing window: '{window_title}' at L:{x} T:{y} W:{width} H:{height}")
-
-        # Capture the screen region of the window
-        with mss.mss() as sct:
-            monitor = {"top": y, "left": x, "width": width, "height": height}
-            print(f"DEBUG: MSS Monitor dict to be used: {monitor}")
-            sct_img = sct.grab(monitor)
-            
+        with WindowCapture(window_title) as capture:
+            # Ensure the window is not minimized for accurate geometry
+            window = capture._find_window()
+            if window is None:
+                print(f"Error: Window with title '{window_title}' not found.")
+                return False
+            if window.isMinimized:
+                print("Window is minimized, attempting to restore...")
+                window.restore()
+                time.sleep(0.5)  # Allow time for window to restore and geometry to update
+
+            frame = capture.grab()
+            if frame is None:
+                print(f"Error: Window '{window_title}' has invalid dimensions. It might be minimized, not rendered, "
+                      f"or an issue with geometry reporting.")
+                return False
+
             # Save to a file
             output_filename = f"{window_title.replace(' ', '_').replace('.', '')}_screenshot.png"
-            mss.tools.to_png(sct_img.rgb, sct_img.size, output=output_filename)
+            cv2.imwrite(output_filename, cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR))
             print(f"Screenshot saved as {output_filename}")
-            print("--- DEBUG INFO END ---\n")
             return True
 
     except Exception as e:
         print(f"An error occurred: {e}")
         return False
 
+
+def _grab_png_per_call(monitor):
+    """The previous capture path: a new mss handle and a PNG encode for every frame."""
+    with mss.mss() as sct:
+        sct_img = sct.grab(monitor)
+        return mss.tools.to_png(sct_img.rgb, sct_img.size)
+
+
+def benchmark_window_capture(window_title, seconds=5.0):
+    """Measures frames/sec of the per-call PNG path against WindowCapture.grab(); returns both rates."""
+    with WindowCapture(window_title) as capture:
+        monitor = capture.monitor()
+        if monitor is None:
+            print(f"Window '{window_title}' can't be captured (missing or minimized)")
+            return None
+
+        rates = {}
+        for name, grab in (('png_per_call', lambda: _grab_png_per_call(monitor)), ('window_capture', capture.grab)):
+            frames = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                grab()
+                frames += 1
+            rates[name] = frames / (time.perf_counter() - start)
+            print(f"{name}: {rates[name]:.1f} frames/sec ({monitor['width']}x{monitor['height']})")
+        print(f"Speedup: {rates['window_capture'] / rates['png_per_call']:.1f}x")
+        return rates
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture a desktop window")
+    parser.add_argument("--benchmark", action="store_true", help="Compare capture frames/sec instead of saving a screenshot")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each benchmark run")
+    args = parser.parse_args()
+
     selected_title = list_and_select_window()
     if selected_title:
-        capture_selected_window(selected_title) 
\ No newline at end of file
+        if args.benchmark:
+            benchmark_window_capture(selected_title, args.seconds)
+        else:
+            capture_selected_window(selected_title)